@@ -0,0 +1,229 @@
+# For typing
+from typing import Generator, Optional
+from Competitor import Competitor
+
+
+class ComparisonStore:
+    """
+    This class remembers the results of all comparisons (matches) as edges of a directed graph (winner -> loser) and
+    answers comparisons whose result is already known, directly or by transitivity (if A beat B and B beat C, A is
+    better than C), without calling the evaluation function again.
+    
+    The transitive closure is kept up to date incrementally: For every competitor, the competitors known to be worse
+    and the competitors known to be better are stored as bitsets (Python ints, bit i -> competitor with index i), so a
+    lookup is a single bit test and recording a result only updates the bitsets of the affected competitors.
+    
+    The closure is only built once it is needed: As long as a comparison is between two competitors that have not
+    lost yet (like every match of the primary competition), it can be answered from the direct results alone. That way,
+    the primary competition (and loading the results of a DecisionLog) only costs a set operation per result and the
+    closure is built in one pass over the graph when the secondary competition starts.
+    
+    Optionally, comparisons can also be answered from ratings (e.g. fitted with ratings.fit_ratings from earlier
+    decisions) if the predicted winner is confident enough (see set_ratings). Predicted results are part of the
+    closure but not of self.decisions, which only holds real (human) decisions, so that ratings are never fitted to
+    their own predictions.
+    """
+    
+    def __init__(self):
+        self.__indices: dict[Competitor, int] = {}    # Competitor -> index (bit position in the bitsets)
+        self.__worse: list[int] = []    # Bitsets: index -> competitors known to be worse
+        self.__better: list[int] = []    # Bitsets: index -> competitors known to be better
+        self.__closed: bool = False    # Whether the bitsets are up to date (see __build_closure)
+        self.__direct: set[tuple[int, int]] = set()    # (winner index, loser index) of all recorded results
+        self.__lost: set[int] = set()    # Indices of the competitors that lost at least once
+        
+        self.decisions: list[tuple[Competitor, Competitor]] = []    # All recorded (winner, loser) pairs (not the
+                # predicted ones)
+        self.evaluated: int = 0    # Number of comparisons that had to be evaluated
+        self.inferred: int = 0    # Number of comparisons answered from the known results
+        self.predicted: int = 0    # Number of comparisons answered from the ratings
+        
+        self.__ratings: dict[Competitor, float] = {}    # Competitor -> Bradley-Terry strength
+        self.__confidence: float = 1.0    # Minimum win probability to answer a comparison from the ratings
+    
+    
+    def set_ratings(self, ratings: dict[Competitor, float], confidence: float):
+        """
+        Lets the store answer comparisons from the given ratings if the predicted winner wins with at least the given
+        probability (so that no human comparison is needed once the ordering is confident).
+        :param ratings: Competitor -> Bradley-Terry strength (see ratings.fit_ratings).
+        :param confidence: Minimum win probability (between 0.5 and 1) of the predicted winner.
+        """
+        
+        self.__ratings = ratings
+        self.__confidence = confidence
+    
+    
+    def get_winner(self, comp_1: Competitor, comp_2: Competitor) -> Optional[Competitor]:
+        """Returns the winner of the two given competitors if it is known (directly or by transitivity), else None."""
+        
+        idx_1, idx_2 = self.__indices.get(comp_1), self.__indices.get(comp_2)
+        if idx_1 is None or idx_2 is None:
+            return None
+        
+        # Without the closure (see class description)
+        if not self.__closed:
+            if (idx_1, idx_2) in self.__direct:
+                return comp_1
+            elif (idx_2, idx_1) in self.__direct:
+                return comp_2
+            elif idx_1 not in self.__lost and idx_2 not in self.__lost:  # Neither can be known to be worse
+                return None
+            self.__build_closure()
+        
+        if self.__worse[idx_1] >> idx_2 & 1:
+            return comp_1
+        elif self.__worse[idx_2] >> idx_1 & 1:
+            return comp_2
+        return None
+    
+    
+    def lookup(self, comp_1: Competitor, comp_2: Competitor) -> Optional[Competitor]:
+        """Returns the winner of the two given competitors if it is known (see get_winner) or if the ratings predict it
+        confidently enough (see set_ratings), else None. Predicted results are recorded (as predicted)."""
+        
+        winner = self.get_winner(comp_1, comp_2)
+        if winner is not None:
+            self.inferred += 1
+            return winner
+        
+        strength_1, strength_2 = self.__ratings.get(comp_1), self.__ratings.get(comp_2)
+        if strength_1 is not None and strength_2 is not None:
+            if strength_1 / (strength_1 + strength_2) >= self.__confidence:
+                winner = comp_1
+            elif strength_2 / (strength_1 + strength_2) >= self.__confidence:
+                winner = comp_2
+            if winner is not None:
+                self.predicted += 1
+                self.record(winner, comp_2 if winner is comp_1 else comp_1, predicted=True)
+        
+        return winner
+    
+    
+    def record(self, winner: Competitor, loser: Competitor, predicted: bool = False):
+        """Records that the winner is better than the loser (and everything that follows from it by transitivity).
+        Only results that are not predicted (see lookup) are added to self.decisions."""
+        
+        idx_w, idx_l = self.__get_index(winner), self.__get_index(loser)
+        if idx_w == idx_l or (idx_l, idx_w) in self.__direct:
+            raise ValueError(f"Cannot record that {winner} beat {loser} because it contradicts the known results.")
+        if not predicted:
+            self.decisions.append((winner, loser))
+        self.__direct.add((idx_w, idx_l))
+        self.__lost.add(idx_l)
+        if not self.__closed:  # Is taken into account when the closure is built
+            return
+        
+        if self.__worse[idx_w] >> idx_l & 1:  # Already known
+            return
+        if self.__worse[idx_l] >> idx_w & 1:
+            raise ValueError(f"Cannot record that {winner} beat {loser} because it contradicts the known results.")
+        
+        # Everyone better than (or equal to) the winner is now better than everyone worse than (or equal to) the loser
+        better_or_winner = self.__better[idx_w] | 1 << idx_w
+        worse_or_loser = self.__worse[idx_l] | 1 << idx_l
+        for idx in self.__iter_bits(better_or_winner):
+            self.__worse[idx] |= worse_or_loser
+        for idx in self.__iter_bits(worse_or_loser):
+            self.__better[idx] |= better_or_winner
+    
+    
+    def record_evaluated(self, winner: Competitor, loser: Competitor):
+        """Records the result of a comparison that had to be evaluated (because lookup did not know its winner) and
+        counts it."""
+        
+        self.evaluated += 1
+        self.record(winner, loser)
+    
+    
+    def iter_evaluate(self, comp_1: Competitor, comp_2: Competitor
+                      ) -> Generator[tuple[Competitor, Competitor], Competitor, Competitor]:
+        """
+        Generator (to be used with 'yield from') that returns the winner of the two given competitors. Only yields the
+        match (and records the winner that is sent back) if the winner is not known or predicted yet (see lookup).
+        :param comp_1:
+        :param comp_2:
+        :return:
+        """
+        
+        winner = self.lookup(comp_1, comp_2)
+        if winner is not None:
+            return winner
+        
+        winner = yield comp_1, comp_2
+        self.record_evaluated(winner, comp_2 if winner is comp_1 else comp_1)
+        
+        return winner
+    
+    
+    def __get_index(self, competitor: Competitor) -> int:
+        """Returns the index of the given competitor (a new one is added if it is not known yet)."""
+        
+        idx = self.__indices.get(competitor)
+        if idx is None:
+            idx = len(self.__worse)
+            self.__indices[competitor] = idx
+            self.__worse.append(0)
+            self.__better.append(0)
+        
+        return idx
+    
+    
+    def __build_closure(self):
+        """Builds the bitsets of all competitors from the recorded results (in one pass over the graph, see
+        __get_reachable). Raises ValueError if the results contradict each other."""
+        
+        losers_of: list[list[int]] = [[] for _ in self.__worse]    # Index -> indices of the directly beaten ones
+        winners_of: list[list[int]] = [[] for _ in self.__worse]    # Index -> indices of the ones it was beaten by
+        for idx_w, idx_l in self.__direct:
+            losers_of[idx_w].append(idx_l)
+            winners_of[idx_l].append(idx_w)
+        
+        self.__worse = self.__get_reachable(losers_of)
+        self.__better = self.__get_reachable(winners_of)
+        self.__closed = True
+    
+    
+    @staticmethod
+    def __get_reachable(edges: list[list[int]]) -> list[int]:
+        """Returns for every node of the given graph (index -> indices of its direct successors) the bitset of all
+        nodes reachable from it. Every node is finished after all of its successors (iterative depth-first search),
+        so its bitset is just the union of theirs. Raises ValueError if the graph contains a cycle (contradicting
+        results)."""
+        
+        reachable = [0] * len(edges)
+        state = [0] * len(edges)    # 0 -> not visited, 1 -> in progress, 2 -> finished
+        for start in range(len(edges)):
+            if state[start]:
+                continue
+            
+            stack = [start]
+            while stack:
+                idx = stack[-1]
+                if state[idx] == 0:
+                    state[idx] = 1
+                    for successor in edges[idx]:
+                        if state[successor] == 1:
+                            raise ValueError("Cannot record the results because they contradict each other.")
+                        if state[successor] == 0:
+                            stack.append(successor)
+                else:
+                    stack.pop()
+                    if state[idx] == 1:
+                        state[idx] = 2
+                        bitset = 0
+                        for successor in edges[idx]:
+                            bitset |= reachable[successor] | 1 << successor
+                        reachable[idx] = bitset
+        
+        return reachable
+    
+    
+    @staticmethod
+    def __iter_bits(bitset: int):
+        """Yields the indices of all set bits of the given bitset."""
+        
+        while bitset:
+            lowest_bit = bitset & -bitset
+            yield lowest_bit.bit_length() - 1
+            bitset ^= lowest_bit
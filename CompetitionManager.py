@@ -1,12 +1,17 @@
+import sys
 import random
 
 # Local project imports
-from Tree import Tree, Node
+from Tree import Tree
+from RankingEngine import RankingEngine
+from ComparisonStore import ComparisonStore
 from ThreadSharedData import ThreadSharedData as tsd
+from match_streams import run_matches, run_matches_async
 
 # For typing
 from Competitor import Competitor
-from typing import MutableSequence, Callable, Optional
+from StateStore import StateStore
+from typing import MutableSequence, Awaitable, Callable, Optional, Generator, Iterator
 
 
 class CompetitionManager:
@@ -17,20 +22,32 @@ class CompetitionManager:
     def __init__(self,
                  competitors: Optional[MutableSequence[Competitor]] = None,
                  shuffle: bool = True,
-                 tree_to_copy: Tree = None
+                 tree_to_copy: Tree = None,
+                 remember_comparisons: bool = True,
+                 state: Optional[StateStore] = None
                  ):
         """
 
         :param competitors:
         :param shuffle:
         :param tree_to_copy:
+        :param remember_comparisons: Whether to use a ComparisonStore (so that no comparison with a known result is
+                                     evaluated). Can be turned off for huge headless competitions because the store
+                                     needs memory quadratic in the number of competitors in the worst case.
+        :param state: Where to share the competition's state (e.g. 'round_info_func'). Defaults to ThreadSharedData.
+                      Needed if several competitions run at once (e.g. with run_primary_async).
         """
         
+        self.state: Optional[StateStore] = state
         self.ranking: list[Competitor] = []  # Later, here will be all competitors sorted by rank
         self.count: int = len(competitors)
+        self.comparisons: int = 0  # Number of evaluation_function calls (-> matches decided by the user)
+        # Remembers all results so no (implied) question is asked twice
+        self.comparison_store: Optional[ComparisonStore] = ComparisonStore() if remember_comparisons else None
         
         if shuffle:
             random.shuffle(competitors)
+        self.initial_order: list[Competitor] = list(competitors or [])  # Order of the leaves (e.g. for DecisionLog)
         
         # Generate or copy tree
         if competitors is not None:
@@ -39,26 +56,82 @@ class CompetitionManager:
             self.tree = tree_to_copy
         else:
             print("Warning: CompetitionManager-Initialization: Cannot pass 'None' for both 'competitors' and "
-                  "'tree_to_copy'.")
+                  "'tree_to_copy'.", file=sys.stderr)
     
     
-    def run_primary(self, evaluation_function: Callable[[Competitor, Competitor], Competitor]):
+    def run_primary(self,
+                    evaluation_function: Callable[[Competitor, Competitor], Competitor],
+                    on_layer_start: Optional[Callable[[list[tuple[Competitor, Competitor]]], None]] = None
+                    ):
         """
 
         :param evaluation_function:
+        :param on_layer_start: Is called with all matches of a layer (in the order they will be evaluated) before the
+                               first of them is evaluated. Can be used to prepare upcoming matches in advance.
         :return:
         """
+        
+        # Evaluate all matches one after another (see iter_primary)
+        run_matches(self.iter_primary(on_layer_start), evaluation_function)
+    
     
+    async def run_primary_async(self,
+                                evaluation_function: Callable[[Competitor, Competitor], Awaitable[Competitor]],
+                                on_layer_start: Optional[Callable[[list[tuple[Competitor, Competitor]]], None]] = None
+                                ):
+        """
+        Like run_primary, but awaits the given (async) evaluation function for every match instead of blocking, so that
+        one event loop can run many competitions (and other I/O) at once.
+        :param evaluation_function: Coroutine function that returns the winner of the two given competitors.
+        :param on_layer_start: See run_primary.
+        :return:
+        """
+        await run_matches_async(self.iter_primary(on_layer_start), evaluation_function)
+    
+    
+    def iter_primary(self, on_layer_start: Optional[Callable[[list[tuple[Competitor, Competitor]]], None]] = None
+                     ) -> Generator[tuple[Competitor, Competitor], Competitor, None]:
+        """
+        Generator that runs the primary competition as a stream of matches: It yields every match (pair of competitors)
+        that needs to be evaluated and expects the winner to be sent back. Matches against None (no competitor) and
+        matches whose winner is already known are not yielded. run_primary is a simple consumer of this stream.
+        
+        The layers are evaluated from the bottom up by iterating over the nodes' indices (see Tree) directly.
+        :param on_layer_start: See run_primary.
+        :return:
+        """
+        
         # Check prerequisite: Competition must not have run before
         if len(self.ranking) != 0:
             print("Warning: Refused to run (primary) competition. self.ranking must be of length 0 but it contains"
-                  f"{len(self.ranking)} elements.")
+                  f"{len(self.ranking)} elements.", file=sys.stderr)
             return
+        
+        # Evaluate winner: Go through each layer from the bottom (the layer above the leaves) to the top (the root)
+        values = self.tree.values
+        for layer in range(self.tree.depth-2, -1, -1):
+            self.__share('round_info_func', self.get_round_info_maker(2**(layer+1)))  # Share round_info function
+            if on_layer_start is not None:
+                on_layer_start(list(self.__iter_layer_matches(layer)))
+            
+            for idx in Tree.layer_range(layer):
+                left_c, right_c = values[2*idx + 1], values[2*idx + 2]  # 'c' -> competitor
+                
+                if left_c is not None and right_c is not None:
+                    winner = yield from self.__evaluate_match(left_c, right_c)
+                elif left_c is None:
+                    winner = right_c
+                else:  # If right is None
+                    winner = left_c
+                
+                self.tree.set_winner(idx, 0 if winner is left_c else 1)
+        
+        self.finish_primary()
+    
     
-        # Evaluate winner
-        for layers_down in range(self.tree.depth-1, 0, -1):
-            tsd.set('round_info_func', self.get_round_info_maker(2**layers_down))  # Share round_info function
-            self.__evaluate_layer(self.tree.root, layers_down, evaluation_function)
+    def finish_primary(self):
+        """Adds the winner of the (completely evaluated) tree to the ranking and changes its title. Is called at the end
+        of the primary competition (also by MatchScheduler, which evaluates the tree without iter_primary)."""
         
         # Add winner to ranking and change title
         winner: Competitor = self.tree.root.val
@@ -66,94 +139,189 @@ class CompetitionManager:
         winner.title = '#1 ' + winner.title
     
     
-    @staticmethod
-    def __evaluate_layer(starting_node: Node,
-                         layers_down: int,
-                         evaluation_function: Callable[[Competitor, Competitor], Competitor]
-                         ):
+    def __evaluate_match(self, comp_1: Competitor, comp_2: Competitor
+                         ) -> Generator[tuple[Competitor, Competitor], Competitor, Competitor]:
+        """
+        Generator (to be used with 'yield from') that yields the match if its winner is not known yet and returns the
+        winner. The result is counted and recorded in the comparison store (see ComparisonStore.iter_evaluate).
+        :param comp_1:
+        :param comp_2:
+        :return:
         """
         
-        :param starting_node:
-        :param layers_down:
-        :param evaluation_function:
+        if self.comparison_store is None:
+            winner = yield comp_1, comp_2
+            self.comparisons += 1
+            return winner
+        
+        evaluated = self.comparison_store.evaluated
+        winner = yield from self.comparison_store.iter_evaluate(comp_1, comp_2)
+        self.comparisons += self.comparison_store.evaluated - evaluated
+        
+        return winner
+    
+    
+    def __iter_layer_matches(self, layer: int) -> Iterator[tuple[Competitor, Competitor]]:
+        """
+        Yields the matches (pairs of competitors) of the nodes in the given layer that need to be evaluated, in the same
+        order as iter_primary evaluates them. Matches against None (no competitor) are left out.
+        :param layer:
         :return:
         """
         
-        # Base case: Determine winner of match
-        if layers_down == 1:
-            left_c, right_c = starting_node.left.val, starting_node.right.val  # 'c' -> competitor
-            
+        values = self.tree.values
+        for idx in Tree.layer_range(layer):
+            left_c, right_c = values[2*idx + 1], values[2*idx + 2]  # 'c' -> competitor
             if left_c is not None and right_c is not None:
-                winner = evaluation_function(left_c, right_c)
-            elif left_c is None:
-                winner = right_c
-            else:  # If right is None
-                winner = left_c
-            
-            starting_node.val = winner
-            starting_node.set_winner(0 if winner is starting_node.left.val else 1)
-            return
-        
-        # Non-base case: Go down one layer and repeat
-        CompetitionManager.__evaluate_layer(starting_node.left, layers_down-1, evaluation_function)
-        CompetitionManager.__evaluate_layer(starting_node.right, layers_down-1, evaluation_function)
+                yield left_c, right_c
     
     
-    def run_secondary(self, evaluation_function: Callable[[Competitor, Competitor], Competitor]):
+    def run_secondary(self,
+                      evaluation_function: Callable[[Competitor, Competitor], Competitor],
+                      mode: str = 'tournament',
+                      k: Optional[int] = None
+                      ):
         """
-
+        Determines the ranks after #1 (all of them or only the ranks #2 to #k). run_secondary is a simple consumer of
+        iter_secondary.
         :param evaluation_function:
+        :param mode: How the ranks are determined:
+                     'tournament' -> Reuses the bracket of run_primary: For every rank, only the matches on the way of
+                                     the previous rank up to the root are replayed (~log2(n) comparisons per rank).
+                     'merge_insertion' -> Sorts all remaining competitors with merge insertion (Ford-Johnson), which
+                                          needs the fewest comparisons when the bracket is not reused.
+                     'scan' -> Compares a leader against all remaining competitors for every rank (~n^2/2 comparisons).
+        :param k: Number of ranks to determine (including #1). All other competitors stay unranked (see
+                  self.unranked). Defaults to all ranks. Not supported by the 'merge_insertion' mode (which always
+                  determines a full ordering).
+        :return:
+        """
+        run_matches(self.iter_secondary(mode, k), evaluation_function)
+    
+    
+    async def run_secondary_async(self,
+                                  evaluation_function: Callable[[Competitor, Competitor], Awaitable[Competitor]],
+                                  mode: str = 'tournament',
+                                  k: Optional[int] = None
+                                  ):
+        """Like run_secondary, but awaits the given (async) evaluation function for every match instead of blocking
+        (see run_primary_async)."""
+        await run_matches_async(self.iter_secondary(mode, k), evaluation_function)
+    
+    
+    def iter_secondary(self, mode: str = 'tournament', k: Optional[int] = None
+                       ) -> Generator[tuple[Competitor, Competitor], Competitor, None]:
+        """
+        Generator that runs the secondary competition (see run_secondary) as a stream of matches, like iter_primary:
+        It yields every match that needs to be evaluated and expects the winner to be sent back. Matches whose winner
+        is already known are not yielded.
+        :param mode: See run_secondary.
+        :param k: See run_secondary.
         :return:
         """
         
         # Check prerequisite: Winner must have been evaluated
         if len(self.ranking) != 1:
             print("Warning: Refused to run (secondary) competition. self.ranking must be of length 1 but it contains"
-                  f"{len(self.ranking)} elements.")
+                  f"{len(self.ranking)} elements.", file=sys.stderr)
+            return
+        
+        # Check prerequisite: k must be valid for the mode
+        if k is not None and mode == 'merge_insertion':
+            print("Warning: Refused to run (secondary) competition. The mode 'merge_insertion' does not support k.",
+                  file=sys.stderr)
             return
+        k = self.count if k is None else max(1, min(k, self.count))
+        
+        # Determine remaining ranks (the engine's matches are evaluated like the ones of iter_primary)
+        if mode == 'tournament':
+            engine = RankingEngine(tree=self.tree)
+            for i in range(1, k):  # Go through each rank
+                self.__share('round_info_func', lambda: f"Rank #{i+1}")  # Share information about current rank searched
+                self.ranking.append((yield from self.__evaluate_matches(engine.iter_next_rank())))
+        elif mode == 'merge_insertion':
+            engine = RankingEngine()
+            self.__share('round_info_func', lambda: f"Determining ranks #2 to #{self.count}")
+            self.ranking += yield from self.__evaluate_matches(engine.iter_merge_insertion_sort(self.__get_losers()))
+        elif mode == 'scan':
+            yield from self.__iter_secondary_scan(k)
+        else:
+            print(f"Warning: Refused to run (secondary) competition. Unknown mode '{mode}'.", file=sys.stderr)
+            return
+        
+        # Change titles: Add rank in front
+        for i, comp in enumerate(self.ranking[1:]):
+            comp.title = f"#{str(i+2)} {comp.title}"
+    
+    
+    def __iter_secondary_scan(self, k: int) -> Generator[tuple[Competitor, Competitor], Competitor, None]:
+        """
+        Determines the ranks #2 to #k by comparing a leader against all remaining competitors for every rank (as a
+        stream of matches).
+        :param k:
+        :return:
+        """
         
-        # Get list of all losers, sorted by max reached level/layer
-        losers = []
-        for layer in range(1, self.tree.depth):  # Go through each layer from top to bottom
-            # Grab all losers of that layer
-            losers += self.__get_losers_from_layer(starting_node=self.tree.root, layers_down=layer)
-        losers = [loser.val for loser in losers]  # Replace every Node in losers by its value
-        losers = list(filter(lambda x: x is not None, losers))  # Filter out NoneTypes
+        losers = self.__get_losers()
         
         # Determine remaining ranks
-        for i in range(1, self.count):  # Go through each rank
+        for i in range(1, k):  # Go through each rank
             leader = losers[0]  # Since the list of losers is kinda sorted, make the first one the leader
-            tsd.set('round_info_func', lambda: f"Rank #{i+1}")  # Share information about current rank searched
+            self.__share('round_info_func', lambda: f"Rank #{i+1}")  # Share information about current rank searched
             
             # Compare leader against all other losers
             for competitor in losers:
                 if competitor is not leader:
-                    leader = evaluation_function(leader, competitor)  # Declare new or stick with old leader
+                    leader = yield from self.__evaluate_match(leader, competitor)  # Declare new or stick with old
+                            # leader
             
             losers.remove(leader)
             self.ranking.append(leader)
-        
-        # Change titles: Add rank in front
-        for i, comp in enumerate(self.ranking[1:]):
-            comp.title = f"#{str(i+2)} {comp.title}"
     
     
-    def __get_losers_from_layer(self, starting_node: Node, layers_down: int):
+    def __get_losers(self) -> list[Competitor]:
         """
-        
+        Returns all losers of the primary competition, sorted by max reached level/layer.
+        :return:
+        """
+        return list(self.__iter_losers())
+    
+    
+    def __iter_losers(self) -> Iterator[Competitor]:
+        """
+        Yields all losers of the primary competition, sorted by max reached level/layer (from the final down to the
+        first round and from left to right within a layer).
         :return:
         """
         
-        # Base case: Return loser of next layer
-        if layers_down == 1:
-            return [starting_node.loser]
-        
-        # Non-base case: Go down layers until layers_down == 1, then get the next layer's losers
-        losers = []
-        losers += self.__get_losers_from_layer(starting_node.left, layers_down=layers_down - 1)
-        losers += self.__get_losers_from_layer(starting_node.right, layers_down=layers_down - 1)
+        values = self.tree.values
+        for layer in range(self.tree.depth-1):  # Go through each layer (that has matches) from top to bottom
+            for idx in Tree.layer_range(layer):
+                loser_idx = self.tree.loser_of(idx)
+                if loser_idx >= 0 and values[loser_idx] is not None:  # Filter out NoneTypes
+                    yield values[loser_idx]
+    
+    
+    def __evaluate_matches(self, matches: Generator[tuple[Competitor, Competitor], Competitor, object]
+                           ) -> Generator[tuple[Competitor, Competitor], Competitor, object]:
+        """
+        Generator (to be used with 'yield from') that passes the matches of the given stream (e.g. of a RankingEngine)
+        on like __evaluate_match (so matches with a known winner are not yielded) and returns what the stream returns.
+        :param matches:
+        :return:
+        """
         
-        return losers
+        try:
+            match = next(matches)
+            while True:
+                match = matches.send((yield from self.__evaluate_match(*match)))
+        except StopIteration as stop:
+            return stop.value
+    
+    
+    def __share(self, key: str, value):
+        """Shares the given value in self.state (or ThreadSharedData if there is none)."""
+        (tsd if self.state is None else self.state).set(key, value)
     
     
     @staticmethod
@@ -189,6 +357,13 @@ class CompetitionManager:
     @property
     def winner(self):
         return self.tree.root.val
+    
+    
+    @property
+    def unranked(self) -> list[Competitor]:
+        """All competitors without a rank (e.g. if only the top k ranks were determined)."""
+        ranked = set(map(id, self.ranking))
+        return [comp for comp in self.__iter_losers() if id(comp) not in ranked]
 
 
 if __name__ == '__main__':
@@ -209,7 +384,7 @@ if __name__ == '__main__':
     eval_fun = max
     cm = CompetitionManager(comps)
     cm.run_primary(evaluation_function=eval_fun)
-    print("should be false:", cm.tree.root.descends_from(Node()))
+    print("should be false:", cm.tree.root.descends_from(cm.tree.root.left))
     print("should be true:", cm.tree.root.left.descends_from(cm.tree.root))
     """
     
@@ -236,3 +411,4 @@ if __name__ == '__main__':
     cm.run_primary(eval_fun)
     cm.run_secondary(eval_fun)
     print(cm.ranking)
+    print("comparisons:", cm.comparisons)
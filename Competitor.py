@@ -1,6 +1,12 @@
-import cv2
-import numpy as np
 import os
+import threading
+
+# Local project imports
+from ImageCache import ImageCache
+from ThumbnailStore import ThumbnailStore
+
+# For typing
+from typing import Optional, Sequence
 
 
 class Competitor:
@@ -8,7 +14,10 @@ class Competitor:
     
     """
     
-    __files_to_delete = []    # If new files are made due to conversion from .jpg to .png
+    resolutions: list[tuple[int, int]] = []    # All resolutions the images are shown in (see register_resolutions)
+    display_encoding: str = 'ppm'    # Encoding of the images that are only shown (see image_processing.encode_image)
+    __decoding: dict[str, threading.Event] = {}    # Paths of the images that are being decoded right now
+    __decoding_lock: threading.Lock = threading.Lock()
     
     def __init__(self, path: str, img_resolution: tuple[int, int]):
         """
@@ -18,83 +27,132 @@ class Competitor:
         
         # Set title
         image_file_name = path.split('/')[-1]
-        self.title = image_file_name[:-4]
+        self.title, self.file_extension = os.path.splitext(image_file_name)  # (Also for '.jpeg')
         
         self.path = path
-        self.file_extension = image_file_name[-4:]
         self.img_resolution = img_resolution
+    
+    
+    @classmethod
+    def register_resolutions(cls, *resolutions: tuple[int, int]):
+        """Registers the given resolutions (e.g. the ones of the window layouts), so that get_img_data produces all of
+        them whenever it has to decode an image."""
         
-        # If .jpg -> add filename to files to delete (it will later be converted to a .png by creating a new image)
-        if image_file_name.endswith(('.jpg', '.jpeg')):
-            self.__files_to_delete.append(self.title + '.png')  # .png because this .jpg gets converted to .png
+        for resolution in map(tuple, resolutions):
+            if resolution not in cls.resolutions:
+                cls.resolutions.append(resolution)
     
     
     def get_img_data(self, resolution: tuple[int, int] = None):
         """
-        
-        :param img_resolution:
-        :param path:
+        Returns the encoded image of the competitor in the given resolution. The result is cached in ImageCache (keyed
+        by path, modification time and resolution), so every image only gets decoded once per resolution, and in
+        ThumbnailStore (on disk), so that it does not need to be decoded again in later sessions either.
+        If the image has to be decoded, all registered resolutions (see register_resolutions) are produced from that
+        single decode and cached as well. The images in memory are encoded with Competitor.display_encoding (fast, e.g.
+        uncompressed), the ones on disk as compressed .png.
+        If another thread is decoding the image already (e.g. the Prefetcher or data_processing.preprocess_images), this
+        waits for it instead of decoding it a second time.
+        :param resolution: Defaults to self.img_resolution.
         :return:
         """
         
-        # Get image
-        img = cv2.imread(self.path)
-        if self.path.endswith('.jpg'):    # If .jpg -> convert to .png (because PySimpleGUI-Images don't support .jpg)
-            filename = self.title + '.png'
-            cv2.imwrite(filename, img)
-            img = cv2.imread(filename)
+        resolution = self.img_resolution if resolution is None else resolution
+        
+        # Check the caches first
+        key = self.__get_key(resolution)
+        img_bytes = self.__get_cached(key)
+        if img_bytes is not None:
+            return img_bytes
         
-        # Resize & reshape to 1:1
-        img = cv2.resize(img, self.img_resolution if resolution is None else resolution)
-        img = self.__get_1to1_img(img)
+        # Wait if another thread is decoding the image already (afterwards, it is cached)
+        with Competitor.__decoding_lock:
+            decoded = Competitor.__decoding.get(self.path)
+            if decoded is None:
+                Competitor.__decoding[self.path] = threading.Event()
+        if decoded is not None:
+            decoded.wait()
+            return self.get_img_data(resolution)
         
-        # Encode image
-        img_bytes = cv2.imencode('.png', img)[1].tobytes()  # I do not know how this works
+        try:
+            # Get image in all resolutions (imported here so that competitions without images, e.g. in cli.py, do not
+            # need to load OpenCV)
+            from image_processing import letterbox_pyramid
+            resolutions = [resolution] + [res for res in self.resolutions if not ImageCache.contains(key[:2] + (res,))]
+            for res, image in letterbox_pyramid(self.path, resolutions).items():
+                res_img_bytes = self.__store(key[:2] + (res,), image)
+                if res == tuple(resolution):
+                    img_bytes = res_img_bytes
+        finally:
+            with Competitor.__decoding_lock:
+                Competitor.__decoding.pop(self.path).set()
         
         return img_bytes
     
     
-    @staticmethod
-    def __get_1to1_img(image):
+    @classmethod
+    def prepare_img_data(cls, competitors: Sequence['Competitor'], resolution: tuple[int, int]):
         """
-
-        :param image:
-        :return:
+        Like get_img_data (without returning anything), but for several competitors at once (e.g. a batch of
+        data_processing.preprocess_images): The images that are not cached yet are decoded one after another and then
+        letterboxed together, into one preallocated array per resolution (see image_processing.letterbox_batch).
+        Images that another thread is decoding already are left to it.
+        :param competitors:
+        :param resolution: The resolution to prepare (all registered resolutions are prepared as well).
         """
         
-        shape_tuple = image.shape
-        height, width = shape_tuple[:2]
-        if width == height:
-            return image
-        else:
-            longer_edge = int(max(width, height))
-            half_diff = int(0.5 * (longer_edge - min(width, height)))
-            if half_diff == 0:
-                half_diff = 1
+        # Claim the images that are not cached and not being decoded
+        missing = [(comp, key) for comp, key in ((comp, comp.__get_key(resolution)) for comp in competitors)
+                   if comp.__get_cached(key) is None]
+        with cls.__decoding_lock:
+            claimed = [(comp, key) for comp, key in missing if comp.path not in cls.__decoding]
+            for comp, _ in claimed:
+                cls.__decoding[comp.path] = threading.Event()
+        if not claimed:
+            return
         
-            if longer_edge == width:
-                filling = np.zeros((half_diff, width), np.uint8)
-                filling = cv2.cvtColor(filling, cv2.COLOR_GRAY2BGR)
-                image = np.concatenate((filling, image, filling))
-            else:
-                row_filling = np.zeros(half_diff, np.uint8)
-                row_filling = cv2.cvtColor(row_filling, cv2.COLOR_GRAY2BGR)
-                row_filling = np.array([bgr_double_list[0] for bgr_double_list in
-                                        row_filling])  # Because row_filling is made out of a list of double lists
-            
-                new_image = []
-                for row in image:
-                    new_row = np.concatenate((row_filling, row, row_filling))
-                    new_image.append(new_row)
-            
-                image = np.array(new_image)
+        try:
+            # (Imported here so that competitions without images do not need to load OpenCV, see get_img_data)
+            from image_processing import decode_image, letterbox_batch
+            resolutions = list(dict.fromkeys([tuple(resolution)] + cls.resolutions))
+            images = [decode_image(comp.path, resolutions) for comp, _ in claimed]
+            for res in resolutions:
+                for (comp, key), image in zip(claimed, letterbox_batch(images, res)):
+                    comp.__store(key[:2] + (res,), image)
+        finally:
+            with cls.__decoding_lock:
+                for comp, _ in claimed:
+                    cls.__decoding.pop(comp.path).set()
+    
+    
+    def __get_key(self, resolution: tuple[int, int]) -> tuple[str, int, tuple[int, int]]:
+        """Returns the ImageCache key of the image in the given resolution (the modification time is part of it so that
+        changed files are not served from cache)."""
+        return self.path, os.stat(self.path).st_mtime_ns, tuple(resolution)
+    
+    
+    def __get_cached(self, key: tuple[str, int, tuple[int, int]]) -> Optional[bytes]:
+        """Returns the cached image of the given key from the ImageCache or from the thumbnails of earlier sessions
+        (ThumbnailStore), else None."""
+        
+        img_bytes = ImageCache.get(key)
+        if img_bytes is None:
+            img_bytes = ThumbnailStore.get(self.path, key[2])
+            if img_bytes is not None:
+                ImageCache.put(key, img_bytes)
         
-            return image
+        return img_bytes
     
     
-    @classmethod
-    def delete_files(cls):
-        current_path = os.path.abspath(os.getcwd())
-        for filename in cls.__files_to_delete:
-            os.remove(os.path.join(current_path, filename))
-            pass
+    def __store(self, key: tuple[str, int, tuple[int, int]], image) -> bytes:
+        """Encodes the given letterboxed image, caches it under the given key (in memory with display_encoding, on disk
+        as compressed .png) and returns the bytes to show."""
+        
+        from image_processing import encode_image
+        png_bytes = encode_image(image, 'png')
+        img_bytes = png_bytes if self.display_encoding == 'png' else encode_image(image, self.display_encoding)
+        ImageCache.put(key, img_bytes)
+        ThumbnailStore.put(self.path, key[2], png_bytes)
+        
+        return img_bytes
+
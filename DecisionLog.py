@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import hashlib
+from array import array
+
+# Local project imports
+from settings import APP_DATA_DIR
+
+# For typing
+from typing import BinaryIO, Callable, MutableSequence, Optional, Sequence
+from Competitor import Competitor
+
+
+LOG_DIR = os.path.join(APP_DATA_DIR, 'logs')
+HISTORY_DIR = os.path.join(APP_DATA_DIR, 'history')    # Decisions of earlier competitions (see get_history)
+FSYNC_INTERVAL = 32    # Number of decisions after which the log is forced to disk (it is flushed after every one)
+
+
+class DecisionLog:
+    """
+    This class appends every decided match of a competition to a small log file (one per folder, in LOG_DIR), so that
+    an interrupted competition can be resumed: The competitors are put into the logged initial order again and the
+    logged decisions are recorded in the ComparisonStore before the competition starts (see ComparisonStore.record and
+    data_processing.prepare_competition). Running the competition again then rebuilds the tree and the ranking exactly
+    as they were without asking for any logged match. Only the matches after the logged ones are asked (and logged).
+    
+    The log starts with a line with a JSON header (the folder and the names of the competitors (see get_name) in their
+    initial (shuffled) order), followed by the decisions as pairs of unsigned 32-bit ints (winner index, loser index;
+    indices into that order; native byte order, since the log never leaves the machine). That way, reading a log with
+    tens of thousands of decisions is a single array operation. An incomplete last decision (e.g. after a crash) is
+    ignored.
+    """
+    
+    def __init__(self, folder: str):
+        """
+        Reads the log of the given folder (if there is one).
+        :param folder: The folder of the competition.
+        """
+        
+        self.folder = folder
+        self.__prefix = folder.rstrip('/') + '/'    # Path prefix of the competitors (see get_name)
+        folder_hash = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()
+        self.path = os.path.join(LOG_DIR, folder_hash + '.log')
+        self.history_path = os.path.join(HISTORY_DIR, folder_hash + '.jsonl')
+        
+        self.order: Optional[list[str]] = None    # Names of the competitors in their initial order (see get_name)
+        self.decisions: list[tuple[int, int]] = []    # (winner index, loser index) of all decisions
+        self.__indices: dict[str, int] = {}    # Name -> index in self.order
+        self.__file: Optional[BinaryIO] = None
+        self.__size: int = 0    # Size (in bytes) of the complete part of the log file
+        self.__unsynced: int = 0    # Number of decisions written since the last fsync
+        
+        self.__read()
+    
+    
+    def restore_order(self, competitors: MutableSequence[Competitor]) -> bool:
+        """Puts the given competitors into the logged initial order (in place) if the log belongs to exactly these
+        competitors. Returns whether it did (if not, the competitors should be shuffled and a new log is started)."""
+        
+        by_name = {self.get_name(comp): comp for comp in competitors}
+        if self.order is None or len(self.order) != len(competitors) or by_name.keys() != self.__indices.keys():
+            return False
+        
+        competitors[:] = [by_name[name] for name in self.order]
+        return True
+    
+    
+    def open(self, competitors: MutableSequence[Competitor]):
+        """Opens the log for appending. If the given competitors (in their initial order) are not the logged ones, a
+        new log is started for them, otherwise the logged decisions are kept (see get_decisions)."""
+        
+        names = list(map(self.get_name, competitors))
+        if names != self.order:
+            self.__archive()  # (Decisions of a log that is not continued)
+            self.order = names
+            self.__indices = {name: i for i, name in enumerate(names)}
+            self.__rewrite()
+            return
+        
+        # Cut off an incomplete last decision and continue the log
+        with open(self.path, 'r+b') as file:
+            file.truncate(self.__size)
+        self.__file = open(self.path, 'ab')
+    
+    
+    def get_decisions(self, competitors: Sequence[Competitor]) -> list[tuple[Competitor, Competitor]]:
+        """Returns the logged decisions as (winner, loser) pairs of the given competitors (in their initial order, see
+        open)."""
+        return [(competitors[w], competitors[l]) for w, l in self.decisions]
+    
+    
+    def wrap(self, evaluation_function: Callable[[Competitor, Competitor], Competitor]
+             ) -> Callable[[Competitor, Competitor], Competitor]:
+        """Returns an evaluation function that calls the given one and logs its results."""
+        
+        def logging_evaluation_function(comp_1: Competitor, comp_2: Competitor) -> Competitor:
+            winner = evaluation_function(comp_1, comp_2)
+            loser = comp_2 if winner is comp_1 else comp_1
+            self.__append((self.__indices[self.get_name(winner)], self.__indices[self.get_name(loser)]))
+            return winner
+        
+        return logging_evaluation_function
+    
+    
+    def close(self):
+        """Forces the log to disk and closes it."""
+        
+        if self.__file is not None:
+            self.__sync()
+            self.__file.close()
+            self.__file = None
+    
+    
+    def get_history(self, competitors: Sequence[Competitor]) -> list[tuple[Competitor, Competitor]]:
+        """Returns the (winner, loser) pairs of the archived decisions of earlier competitions in this folder (see
+        delete) between the given competitors, e.g. to fit ratings with (see ratings.fit_ratings)."""
+        
+        by_name = {self.get_name(comp): comp for comp in competitors}
+        history = []
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        winner, loser = (by_name.get(name) for name in json.loads(line))
+                    except (ValueError, TypeError):  # E.g. an incomplete last line
+                        continue
+                    if winner is not None and loser is not None:
+                        history.append((winner, loser))
+        except FileNotFoundError:
+            pass
+        
+        return history
+    
+    
+    def delete(self):
+        """Closes and deletes the log (e.g. when the competition is finished). Its decisions are archived first (see
+        get_history), so that they are not lost for the ratings of later competitions."""
+        
+        self.close()
+        self.__archive()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+    
+    
+    def get_name(self, competitor: Competitor) -> str:
+        """Returns the name that identifies the given competitor in the log (its path relative to the folder, e.g. its
+        file name)."""
+        
+        if competitor.path.startswith(self.__prefix):  # (Much faster than os.path.relpath for huge folders)
+            return competitor.path[len(self.__prefix):]
+        return os.path.relpath(competitor.path, self.folder)
+    
+    
+    def __read(self):
+        """Reads the header and the decisions of the log (if there is one)."""
+        
+        try:
+            with open(self.path, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            return
+        
+        try:
+            header_end = content.index(b'\n') + 1
+            order = json.loads(content[:header_end])['order']
+            indices = array('I')
+            indices.frombytes(content[header_end:header_end + (len(content) - header_end) // 8 * 8])
+        except (ValueError, KeyError, TypeError):
+            print(f"Warning: Ignored invalid decision log at {self.path}", file=sys.stderr)
+            return
+        
+        self.order = order
+        self.__indices = {name: i for i, name in enumerate(order)}
+        self.decisions = list(zip(indices[0::2], indices[1::2]))
+        self.__size = header_end + len(indices) * indices.itemsize
+    
+    
+    def __archive(self):
+        """Appends the logged decisions (by the names of the competitors) to the history of the folder."""
+        
+        if not self.decisions:
+            return
+        try:
+            os.makedirs(HISTORY_DIR, exist_ok=True)
+            with open(self.history_path, 'a', encoding='utf-8') as file:
+                file.writelines(json.dumps([self.order[w], self.order[l]]) + '\n' for w, l in self.decisions)
+        except OSError as e:
+            print(f"Warning: Could not archive the decisions of {self.folder} ({e})", file=sys.stderr)
+        self.decisions = []
+    
+    
+    def __rewrite(self):
+        """Writes the whole log (header and all decisions so far) anew and opens it for appending."""
+        
+        if self.__file is not None:
+            self.__file.close()
+        os.makedirs(LOG_DIR, exist_ok=True)
+        
+        # Write to a temporary file first and replace the old log with it (so that there always is a complete log)
+        with open(self.path + '.tmp', 'wb') as file:
+            file.write(json.dumps({'folder': os.path.abspath(self.folder), 'order': self.order}).encode() + b'\n')
+            file.write(array('I', [idx for decision in self.decisions for idx in decision]).tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + '.tmp', self.path)
+        
+        self.__file = open(self.path, 'ab')
+        self.__unsynced = 0
+    
+    
+    def __append(self, decision: tuple[int, int]):
+        """Adds a new decision to the log (forced to disk every FSYNC_INTERVAL decisions)."""
+        
+        self.decisions.append(decision)
+        self.__file.write(array('I', decision).tobytes())
+        self.__file.flush()  # Survives the program being closed or crashing
+        
+        self.__unsynced += 1
+        if self.__unsynced >= FSYNC_INTERVAL:
+            self.__sync()
+    
+    
+    def __sync(self):
+        """Forces everything written so far to disk (survives power loss)."""
+        
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__unsynced = 0
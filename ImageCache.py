@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+
+# For typing
+from typing import Optional
+
+
+DEFAULT_MAX_BYTES = 64 * 1024**2    # Default byte budget of the cache (64 MiB)
+
+
+def lock_cache(func):
+    """Decorator function. Wrapper acquires and releases a threading.Lock (taken from variable ImageCache.lock) to
+    prevent race conditions."""
+    
+    def wrapper(cls, *args):
+        with cls.lock:
+            return func(cls, *args)
+    
+    return wrapper
+
+
+class ImageCache:
+    """
+    This class is a process-wide cache for encoded images (the bytes that are given to sg.Image.update). Entries are
+    evicted in least-recently-used order as soon as the sum of the cached bytes exceeds the byte budget.
+    
+    Like ThreadSharedData, you are not meant to create instances of this class but only use the class itself (all
+    methods are class methods). Unlike ThreadSharedData, no initialization is needed (but it can be used to change the
+    byte budget).
+    """
+    
+    __entries: OrderedDict = OrderedDict()    # Maps keys to encoded images, ordered from least to most recently used
+    max_bytes: int = DEFAULT_MAX_BYTES    # Byte budget
+    size: int = 0    # Sum of the lengths of all cached images (in bytes)
+    hits: int = 0
+    misses: int = 0
+    lock: threading.Lock = threading.Lock()    # To prevent race conditions
+    
+    @classmethod
+    @lock_cache
+    def init(cls, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Clears the cache, resets the counters and sets the byte budget.
+        :param max_bytes: The maximum number of bytes to hold. Defaults to DEFAULT_MAX_BYTES.
+        """
+        
+        cls.__entries.clear()
+        cls.max_bytes = max_bytes
+        cls.size = 0
+        cls.hits = 0
+        cls.misses = 0
+    
+    @classmethod
+    @lock_cache
+    def get(cls, key) -> Optional[bytes]:
+        """Returns the image data corresponding to the given key or None if it is not cached. Also updates the hit/miss
+        counters."""
+        
+        data = cls.__entries.get(key)
+        if data is None:
+            cls.misses += 1
+        else:
+            cls.hits += 1
+            cls.__entries.move_to_end(key)  # Mark as most recently used
+        
+        return data
+    
+    @classmethod
+    @lock_cache
+    def put(cls, key, data: bytes):
+        """Adds/updates the image data for the given key and evicts least recently used entries if the byte budget is
+        exceeded. Data larger than the whole budget is not cached at all."""
+        
+        if len(data) > cls.max_bytes:
+            return
+        
+        # Replace old entry (if there is one)
+        old_data = cls.__entries.pop(key, None)
+        if old_data is not None:
+            cls.size -= len(old_data)
+        cls.__entries[key] = data
+        cls.size += len(data)
+        
+        # Evict least recently used entries until the budget is kept
+        while cls.size > cls.max_bytes:
+            _, evicted_data = cls.__entries.popitem(last=False)
+            cls.size -= len(evicted_data)
+    
+    @classmethod
+    @lock_cache
+    def contains(cls, key) -> bool:
+        """Returns whether the given key is cached (without counting as a hit/miss or marking it as recently used)."""
+        return key in cls.__entries
+    
+    @classmethod
+    @lock_cache
+    def stats(cls) -> dict:
+        """Returns the hit/miss counters, the number of entries and the used and available bytes."""
+        return {'hits': cls.hits, 'misses': cls.misses, 'entries': len(cls.__entries), 'size': cls.size,
+                'max_bytes': cls.max_bytes}
@@ -0,0 +1,257 @@
+import time
+import threading
+import itertools
+from collections import deque
+
+# Local project imports
+from Tree import Tree
+
+# For typing
+from typing import Callable, Iterable, Optional
+from Competitor import Competitor
+from CompetitionManager import CompetitionManager
+
+
+DEFAULT_LEASE_DURATION = 60.0    # Seconds a judge has to decide a claimed match before it is given to another judge
+
+
+class Lease:
+    """A claimed match: the judge that claimed it is expected to decide it (see MatchScheduler.decide) before the lease
+    expires."""
+    
+    __slots__ = ('id', 'idx', 'competitors', 'expires')
+    
+    def __init__(self, lease_id: int, idx: int, competitors: tuple[Competitor, Competitor], expires: float):
+        """
+        
+        :param lease_id: Identifies the lease (e.g. for clients of judge_server).
+        :param idx: The index of the tree node whose match is claimed.
+        :param competitors: The two competitors of the match.
+        :param expires: The time (time.monotonic) at which the lease expires.
+        """
+        
+        self.id = lease_id
+        self.idx = idx
+        self.competitors = competitors
+        self.expires = expires
+
+
+class MatchScheduler:
+    """
+    This class runs the primary competition of a CompetitionManager with several judges at once (e.g. worker threads,
+    windows or clients of judge_server): Every match whose two competitors are known (both children of its node are
+    decided) is ready and put into a work queue. Judges claim ready matches (claim), which gives them a lease, and
+    decide them (decide). As soon as both matches below a node are decided, its match becomes ready, so the next layer
+    opens match by match instead of after the whole layer.
+    
+    Leases that expire (e.g. because a judge disappeared) are put back at the front of the queue and claimed by the next
+    judge. If several judges decide the same match, the first decision counts.
+    
+    Matches against None (no competitor) and matches whose winner is already known (ComparisonStore) are resolved
+    without a judge, like in CompetitionManager.iter_primary. When the root is decided, the winner is added to the
+    ranking (CompetitionManager.finish_primary), so run_secondary can follow as usual.
+    """
+    
+    def __init__(self, competition_manager: CompetitionManager, lease_duration: float = DEFAULT_LEASE_DURATION):
+        """
+        
+        :param competition_manager: A competition manager whose primary competition has not run yet.
+        :param lease_duration: Seconds a judge has to decide a claimed match.
+        """
+        
+        self.competition_manager = competition_manager
+        self.lease_duration = lease_duration
+        
+        tree = competition_manager.tree
+        self.__tree = tree
+        self.__resolved: list[bool] = [tree.is_leaf(idx) for idx in range(len(tree.values))]
+        self.__ready: deque[int] = deque()    # Indices of the nodes whose matches are ready (and not claimed)
+        self.__leases: dict[int, Lease] = {}    # Lease id -> unexpired lease
+        self.__leased_nodes: dict[int, int] = {}    # Lease id -> node index of every lease (also expired ones)
+        self.__lease_ids = itertools.count()
+        self.__finished: bool = False
+        self.__condition = threading.Condition()
+        
+        # Find the ready matches of the lowest layer (the layers above follow from the decisions)
+        with self.__condition:
+            if tree.depth == 1:
+                self.__finish()
+            else:
+                for idx in Tree.layer_range(tree.depth - 2):
+                    self.__check(idx)
+    
+    
+    def claim(self, timeout: Optional[float] = None) -> Optional[Lease]:
+        """
+        Claims the next ready match. Blocks until a match is ready.
+        :param timeout: Maximum number of seconds to wait. Defaults to waiting forever.
+        :return: The lease of the claimed match or None if the competition is finished (or the timeout expired).
+        """
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__condition:
+            while True:
+                self.__requeue_expired()
+                if self.__finished:
+                    return None
+                if self.__ready:
+                    idx = self.__ready.popleft()
+                    values = self.__tree.values
+                    lease = Lease(next(self.__lease_ids), idx, (values[2*idx + 1], values[2*idx + 2]),
+                                  time.monotonic() + self.lease_duration)
+                    self.__leases[lease.id] = lease
+                    self.__leased_nodes[lease.id] = idx
+                    return lease
+                
+                # Wait for a decision, a new match, the next lease to expire or the timeout
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                wait_until = min([lease.expires for lease in self.__leases.values()]
+                                 + ([deadline] if deadline is not None else []), default=None)
+                self.__condition.wait(None if wait_until is None else max(0.0, wait_until - time.monotonic()))
+    
+    
+    def decide(self, lease_id: int, winner: Competitor) -> bool:
+        """Decides the match of the given lease. Returns False (and changes nothing) if the match has already been
+        decided (e.g. by another judge after the lease expired) or if the lease or the winner is unknown."""
+        
+        with self.__condition:
+            idx = self.__leased_nodes.get(lease_id)
+            if idx is None or self.__resolved[idx]:
+                return False
+            values = self.__tree.values
+            left_c, right_c = values[2*idx + 1], values[2*idx + 2]  # 'c' -> competitor
+            if winner is not left_c and winner is not right_c:
+                return False
+            
+            # Drop the match from the queue and from all leases (if it was requeued or claimed again)
+            if idx in self.__ready:
+                self.__ready.remove(idx)
+            for other_id in [other_id for other_id, lease in self.__leases.items() if lease.idx == idx]:
+                del self.__leases[other_id]
+            
+            # Count and record the result
+            cm = self.competition_manager
+            cm.comparisons += 1
+            if cm.comparison_store is not None:
+                cm.comparison_store.record_evaluated(winner, right_c if winner is left_c else left_c)
+            
+            self.__resolve(idx, 0 if winner is left_c else 1)
+            return True
+    
+    
+    def release(self, lease_id: int):
+        """Gives the match of the given lease back (e.g. if the judge skips it), so that the next judge can claim it."""
+        
+        with self.__condition:
+            lease = self.__leases.pop(lease_id, None)
+            if lease is not None and not self.__resolved[lease.idx]:
+                self.__ready.appendleft(lease.idx)
+                self.__condition.notify()
+    
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the primary competition is finished. Returns False if the timeout expired before."""
+        
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.__finished, timeout)
+    
+    
+    @property
+    def finished(self) -> bool:
+        return self.__finished
+    
+    
+    def run_judge(self, evaluation_function: Callable[[Competitor, Competitor], Competitor]):
+        """Claims and decides matches with the given evaluation function until the competition is finished (e.g. as
+        the target of a thread)."""
+        
+        while (lease := self.claim()) is not None:
+            self.decide(lease.id, evaluation_function(*lease.competitors))
+    
+    
+    def run_judges(self, evaluation_functions: Iterable[Callable[[Competitor, Competitor], Competitor]]):
+        """Runs one thread per given evaluation function (see run_judge) and blocks until the competition is
+        finished."""
+        
+        threads = [threading.Thread(target=self.run_judge, args=(evaluation_function,), daemon=True)
+                   for evaluation_function in evaluation_functions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    
+    def __check(self, idx: int):
+        """Checks whether the match of the node with the given index can be played (both children are decided) and
+        resolves it directly or puts it into the queue. Must be called with the lock acquired."""
+        
+        left_idx, right_idx = Tree.children_of(idx)
+        if not (self.__resolved[left_idx] and self.__resolved[right_idx]):
+            return
+        
+        values = self.__tree.values
+        left_c, right_c = values[left_idx], values[right_idx]  # 'c' -> competitor
+        if left_c is None or right_c is None:
+            self.__resolve(idx, 1 if left_c is None else 0)
+            return
+        
+        store = self.competition_manager.comparison_store
+        known_winner = store.lookup(left_c, right_c) if store is not None else None
+        if known_winner is not None:
+            self.__resolve(idx, 0 if known_winner is left_c else 1)
+        else:
+            self.__ready.append(idx)
+            self.__condition.notify()
+    
+    
+    def __resolve(self, idx: int, winner: int):
+        """Sets the winner (0 -> left, 1 -> right) of the node with the given index and checks whether its parent's
+        match can be played now. Must be called with the lock acquired."""
+        
+        self.__tree.set_winner(idx, winner)
+        self.__resolved[idx] = True
+        if idx == 0:
+            self.__finish()
+        else:
+            self.__check(Tree.parent_of(idx))
+    
+    
+    def __finish(self):
+        """Ends the primary competition and wakes up all waiting judges. Must be called with the lock acquired."""
+        
+        self.competition_manager.finish_primary()
+        self.__finished = True
+        self.__leases.clear()
+        self.__condition.notify_all()
+    
+    
+    def __requeue_expired(self):
+        """Puts the matches of expired leases back at the front of the queue. Must be called with the lock
+        acquired."""
+        
+        now = time.monotonic()
+        for lease in [lease for lease in self.__leases.values() if lease.expires <= now]:
+            del self.__leases[lease.id]
+            if not self.__resolved[lease.idx]:
+                self.__ready.appendleft(lease.idx)
+
+
+if __name__ == '__main__':
+    # Benchmark: throughput with 1, 4 and 16 judges that need 5 ms per match (e.g. humans in a real setting)
+    class _Competitor:
+        def __init__(self, strength: int):
+            self.strength = strength
+            self.title = str(strength)
+    
+    def _slow_evaluation_function(comp_1, comp_2):
+        time.sleep(0.005)
+        return comp_1 if comp_1.strength > comp_2.strength else comp_2
+    
+    for _judges in (1, 4, 16):
+        _cm = CompetitionManager([_Competitor(i) for i in range(256)])
+        _scheduler = MatchScheduler(_cm)
+        _start = time.perf_counter()
+        _scheduler.run_judges([_slow_evaluation_function] * _judges)
+        print(f"{_judges} judges: {_cm.comparisons} matches in {time.perf_counter() - _start:.2f}s, "
+              f"winner: {_cm.winner.title}")
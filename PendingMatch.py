@@ -0,0 +1,75 @@
+import threading
+
+# For typing
+from typing import Optional
+from Competitor import Competitor
+
+
+class CompetitionCancelled(Exception):
+    """Raised in the thread waiting for a match's winner if the match (or the whole competition) was cancelled."""
+
+
+class PendingMatch:
+    """
+    This class hands over the winner of a single match from the thread that decides it (the GUI thread) to the thread
+    that waits for it (the thread running the competition). The waiting thread is woken up as soon as the winner is
+    decided or the match is cancelled.
+    """
+    
+    def __init__(self, comp_1: Competitor, comp_2: Competitor):
+        """
+        
+        :param comp_1:
+        :param comp_2:
+        """
+        
+        self.competitors: tuple[Competitor, Competitor] = (comp_1, comp_2)
+        self.__winner: Optional[Competitor] = None
+        self.__cancelled: bool = False
+        self.__done = threading.Event()
+        self.__lock = threading.Lock()    # So that a match can only be decided or cancelled once
+    
+    
+    def decide(self, winner: Competitor) -> bool:
+        """Sets the winner of the match and wakes up the waiting thread. Returns False (and changes nothing) if the
+        match has already been decided or cancelled."""
+        
+        with self.__lock:
+            if self.__done.is_set():
+                return False
+            self.__winner = winner
+            self.__done.set()
+            return True
+    
+    
+    def cancel(self) -> bool:
+        """Cancels the match and wakes up the waiting thread (which then raises CompetitionCancelled). Returns False
+        (and changes nothing) if the match has already been decided or cancelled."""
+        
+        with self.__lock:
+            if self.__done.is_set():
+                return False
+            self.__cancelled = True
+            self.__done.set()
+            return True
+    
+    
+    def wait(self, timeout: Optional[float] = None) -> Competitor:
+        """
+        Blocks until the match is decided and returns the winner.
+        :param timeout: Maximum number of seconds to wait. Defaults to waiting forever.
+        :raises TimeoutError: If the timeout expired before the match was decided.
+        :raises CompetitionCancelled: If the match was cancelled.
+        """
+        
+        if not self.__done.wait(timeout):
+            raise TimeoutError(f"No winner was chosen within {timeout} seconds.")
+        if self.__cancelled:
+            raise CompetitionCancelled()
+        
+        return self.__winner
+    
+    
+    @property
+    def done(self) -> bool:
+        return self.__done.is_set()
@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+
+# For typing
+from typing import Iterable, Optional
+from Competitor import Competitor
+
+
+DEFAULT_DEPTH = 4    # Number of upcoming matches whose images are prepared in advance
+
+
+class Prefetcher:
+    """
+    This class decodes and encodes the images of upcoming matches in background threads (cv2 releases the GIL while
+    doing so) while the user is still deciding the current match. The results end up in the ImageCache, so showing
+    the next match does not need to wait for decoding.
+    
+    The upcoming matches are given via schedule (e.g. once per layer of the bracket), the cursor is moved via advance
+    (once per shown match). Only the images of the next 'depth' matches are prepared at a time, work for matches that
+    are no longer upcoming is cancelled.
+    """
+    
+    def __init__(self, resolution: tuple[int, int], depth: int = DEFAULT_DEPTH, workers: Optional[int] = None):
+        """
+        
+        :param resolution: The resolution to prepare the images in (passed to Competitor.get_img_data).
+        :param depth: The number of upcoming matches to prepare the images of (ahead of the current one).
+        :param workers: The number of threads to use. Defaults to the number of CPUs.
+        """
+        
+        self.resolution = resolution
+        self.depth = depth
+        
+        self.__executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix='prefetch')
+        self.__current: tuple[Competitor, ...] = ()    # The match that is currently shown
+        self.__upcoming: deque[tuple[Competitor, Competitor]] = deque()    # Matches that have not been shown yet
+        self.__futures: dict[Competitor, Future] = {}    # Prepared/in-progress images of upcoming competitors
+        self.__lock = threading.Lock()
+    
+    
+    def schedule(self, matches: Iterable[tuple[Competitor, Competitor]]):
+        """Replaces the upcoming matches by the given ones (in the order they will be shown) and starts preparing the
+        images of the first ones."""
+        
+        with self.__lock:
+            self.__upcoming = deque(matches)
+            self.__refill()
+    
+    
+    def advance(self, match: tuple[Competitor, Competitor]):
+        """Moves the cursor to the given match (the one that is about to be shown): all matches before it are
+        dropped. If the match is not upcoming at all (e.g. because it was not known in advance), nothing changes."""
+        
+        with self.__lock:
+            if match not in self.__upcoming:
+                return
+            while self.__upcoming[0] != match:
+                self.__upcoming.popleft()
+            self.__current = self.__upcoming.popleft()
+            self.__refill()
+    
+    
+    def get_img_data(self, competitor: Competitor) -> bytes:
+        """Returns the image data of the given competitor. If it is being prepared, waits for that instead of
+        decoding it a second time (unless the work is cancelled in the meantime)."""
+        
+        with self.__lock:
+            future = self.__futures.get(competitor)
+        
+        if future is not None:
+            try:
+                return future.result()
+            except CancelledError:  # (E.g. by advance or shutdown in another thread)
+                pass
+        
+        return competitor.get_img_data(self.resolution)
+    
+    
+    def shutdown(self):
+        """Cancels all pending work and stops the threads (without waiting for running work)."""
+        
+        with self.__lock:
+            self.__current = ()
+            self.__upcoming.clear()
+            self.__futures.clear()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+    
+    
+    def __refill(self):
+        """Cancels the work for competitors that are not part of the current or the next 'depth' matches and starts
+        it for the ones that are. Must be called with the lock acquired."""
+        
+        # Competitors of the current and the next matches (in order)
+        needed = list(self.__current)
+        for i, match in enumerate(self.__upcoming):
+            if i == self.depth:
+                break
+            needed += [comp for comp in match if comp not in needed]
+        
+        # Cancel work that is no longer relevant (finished work is in the ImageCache anyway)
+        for comp in list(self.__futures):
+            if comp not in needed:
+                self.__futures.pop(comp).cancel()
+        
+        # Start work for new competitors
+        for comp in needed:
+            if comp not in self.__futures:
+                self.__futures[comp] = self.__executor.submit(comp.get_img_data, self.resolution)
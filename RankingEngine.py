@@ -0,0 +1,160 @@
+# Local project imports
+from Tree import Tree
+from match_streams import run_matches
+
+# For typing
+from typing import Callable, Generator, Optional, Sequence
+from Competitor import Competitor
+
+
+class RankingEngine:
+    """
+    This class determines the ranks after #1 with as few comparisons (evaluation_function calls -> user clicks) as
+    possible. It supports two modes:
+    
+    - Tournament (tournament sort): Reuses the already evaluated bracket. To find the next rank, the previous one is
+      removed from its leaf and only the matches on its way up to the root are replayed (~log2(n) comparisons per rank).
+    - Merge insertion (Ford-Johnson): Sorts a sequence of competitors from scratch with the minimum number of
+      comparisons (in the worst case) that is known for comparison sorting.
+    
+    The number of comparisons used is counted in self.comparisons.
+    
+    Both modes are also available as streams of matches (iter_next_rank, iter_merge_insertion_sort; see match_streams),
+    which yield every comparison instead of calling the evaluation function, so that the winners can come from anywhere
+    (e.g. a coroutine or CompetitionManager's comparison store).
+    """
+    
+    def __init__(self, evaluation_function: Optional[Callable[[Competitor, Competitor], Competitor]] = None,
+                 tree: Tree = None):
+        """
+        
+        :param evaluation_function: Returns the winner of the two given competitors. Not needed if only the streams
+                                    (iter_ methods) are used.
+        :param tree: A tree whose primary competition has already been evaluated. Only needed for the tournament mode.
+                     The tree itself is not changed.
+        """
+        
+        self.evaluation_function = evaluation_function
+        self.comparisons: int = 0
+        
+        # Node values in heap order (root at 0, children of i at 2i+1 and 2i+2) that can be changed while replaying
+        self.__values: list[Optional[Competitor]] = list(tree.values) if tree is not None else []
+    
+    
+    def __compare(self, comp_1: Competitor, comp_2: Competitor
+                  ) -> Generator[tuple[Competitor, Competitor], Competitor, Competitor]:
+        """Generator (to be used with 'yield from') that yields the match, counts the comparison and returns the winner
+        that was sent back."""
+        
+        self.comparisons += 1
+        winner = yield comp_1, comp_2
+        return winner
+    
+    
+    # Tournament mode ##################################################################################################
+    
+    def next_rank(self) -> Optional[Competitor]:
+        """Removes the current leader (the value of the root) from the bracket, replays the matches on its way up to
+        the root and returns the new leader (or None if there is no competitor left)."""
+        return run_matches(self.iter_next_rank(), self.evaluation_function)
+    
+    
+    def iter_next_rank(self) -> Generator[tuple[Competitor, Competitor], Competitor, Optional[Competitor]]:
+        """Like next_rank, but as a stream of matches (see match_streams) that returns the new leader."""
+        
+        values = self.__values
+        if len(values) == 0 or values[0] is None:
+            return None
+        
+        # Find the leaf of the current leader by following it down from the root
+        leader = values[0]
+        idx = 0
+        while 2*idx + 1 < len(values):
+            idx = 2*idx + 1 if values[2*idx + 1] is leader else 2*idx + 2
+        values[idx] = None
+        
+        # Replay the matches on the way up to the root
+        while idx > 0:
+            idx = (idx - 1) // 2
+            left_c, right_c = values[2*idx + 1], values[2*idx + 2]  # 'c' -> competitor
+            if left_c is not None and right_c is not None:
+                values[idx] = yield from self.__compare(left_c, right_c)
+            elif left_c is None:
+                values[idx] = right_c
+            else:  # If right is None
+                values[idx] = left_c
+        
+        return values[0]
+    
+    
+    # Merge insertion mode #############################################################################################
+    
+    def merge_insertion_sort(self, competitors: Sequence[Competitor]) -> list[Competitor]:
+        """Returns the given competitors sorted from best to worst, determined with merge insertion (Ford-Johnson)."""
+        return run_matches(self.iter_merge_insertion_sort(competitors), self.evaluation_function)
+    
+    
+    def iter_merge_insertion_sort(self, competitors: Sequence[Competitor]
+                                  ) -> Generator[tuple[Competitor, Competitor], Competitor, list[Competitor]]:
+        """Like merge_insertion_sort, but as a stream of matches (see match_streams) that returns the sorted
+        competitors."""
+        
+        chain = yield from self.__merge_insertion(list(competitors))
+        return chain[::-1]
+    
+    
+    def __merge_insertion(self, competitors: list[Competitor]
+                          ) -> Generator[tuple[Competitor, Competitor], Competitor, list[Competitor]]:
+        """Recursively sorts the given competitors from worst to best (as a stream of matches).
+        
+        1. Pair up the competitors and compare each pair.
+        2. Recursively sort the pairs' winners (-> main chain). Each loser is known to be worse than its winner.
+        3. Insert the losers into the main chain with binary search, in the order of the Jacobsthal numbers (so that
+           every binary search is done on a chain of length 2^k - 1 at most).
+        """
+        
+        if len(competitors) <= 1:
+            return competitors
+        
+        # Compare pairs
+        loser_of = {}  # Winner -> loser
+        for comp_1, comp_2 in zip(competitors[0::2], competitors[1::2]):
+            winner = yield from self.__compare(comp_1, comp_2)
+            loser_of[winner] = comp_2 if winner is comp_1 else comp_1
+        straggler = competitors[-1] if len(competitors) % 2 == 1 else None
+        
+        # Sort the winners, the loser of the worst winner can be put in front of it without any comparisons
+        winners = yield from self.__merge_insertion(list(loser_of))
+        chain = [loser_of[winners[0]]] + winners
+        pending = [(loser_of[winner], winner) for winner in winners[1:]]  # Losers with the winner they lost to
+        if straggler is not None:
+            pending.append((straggler, None))  # The straggler needs to be inserted into the whole chain
+        
+        # Insert pending losers, in groups ending at the Jacobsthal numbers (and from last to first within a group)
+        group_start, prev_jacobsthal, jacobsthal = 0, 1, 3
+        while group_start < len(pending):
+            group_end = min(jacobsthal - 1, len(pending))
+            for loser, winner in reversed(pending[group_start:group_end]):
+                upper_bound = len(chain) if winner is None else next(i for i, c in enumerate(chain) if c is winner)
+                chain.insert((yield from self.__binary_search(chain, loser, upper_bound)), loser)
+            group_start = group_end
+            prev_jacobsthal, jacobsthal = jacobsthal, jacobsthal + 2*prev_jacobsthal
+        
+        return chain
+    
+    
+    def __binary_search(self, chain: list[Competitor], competitor: Competitor, upper_bound: int
+                        ) -> Generator[tuple[Competitor, Competitor], Competitor, int]:
+        """Returns the index in chain[:upper_bound] (sorted from worst to best) at which the competitor needs to be
+        inserted (as a stream of matches)."""
+        
+        low, high = 0, upper_bound
+        while low < high:
+            mid = (low + high) // 2
+            winner = yield from self.__compare(competitor, chain[mid])
+            if winner is competitor:  # If better than chain[mid] -> search above
+                low = mid + 1
+            else:
+                high = mid
+        
+        return low
@@ -0,0 +1,161 @@
+import threading
+from types import MappingProxyType
+
+# For typing
+from typing import Any, Callable, Collection, Hashable, Mapping, Optional
+
+
+class StateStore:
+    """
+    This class holds state (key-value pairs) that is shared between threads, e.g. all the state of one competition.
+    Unlike ThreadSharedData (which uses one StateStore for the whole app), you can create as many instances as you
+    need, e.g. one per competition if several competitions run in one process.
+    
+    Reads are lock-free: The data is never changed in place. Every write builds a new dictionary (copy-on-write, which
+    is cheap for the few keys of a competition) and replaces the current snapshot with it in a single assignment. So a
+    reader always sees a consistent state, and snapshots that were handed out never change (the values themselves are
+    not copied though). Writes of several keys at once (update) are atomic: Readers see either all of them or none.
+    
+    Every write increases the version of the store, and every written key remembers the version of its last write
+    (get_version). Consumers can block until one of the keys they care about changes (wait_for_change) or be called
+    after every change (subscribe) instead of polling.
+    """
+    
+    def __init__(self, data: Optional[Mapping] = None):
+        """
+        
+        :param data: The data to hold right away. Defaults to nothing.
+        """
+        
+        data = dict(data or {})
+        self.__data: Mapping = MappingProxyType(data)    # The current snapshot (replaced, never changed)
+        self.__versions: Mapping = MappingProxyType(dict.fromkeys(data, 1 if data else 0))    # Key -> version of its
+                # last write (also for keys that were deleted)
+        self.__version: int = 1 if data else 0
+        self.__subscribers: dict[int, tuple[Callable[[Mapping, frozenset], None], Optional[frozenset]]] = {}
+        self.__next_subscriber_id: int = 0
+        self.__condition = threading.Condition()    # Serializes writes and wakes up waiting consumers
+    
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value corresponding to the given key (or the given default if there is none)."""
+        return self.__data.get(key, default)
+    
+    
+    def snapshot(self) -> Mapping:
+        """Returns all the data as an immutable mapping that does not change when the store changes."""
+        return self.__data
+    
+    
+    def get_all(self) -> Mapping:
+        """Returns all the data (see snapshot)."""
+        return self.__data
+    
+    
+    def get_keys(self) -> tuple:
+        """Returns all keys."""
+        return tuple(self.__data.keys())
+    
+    
+    def get_values(self) -> tuple:
+        """Returns all values."""
+        return tuple(self.__data.values())
+    
+    
+    @property
+    def version(self) -> int:
+        """The number of writes so far (the version of the last write)."""
+        return self.__version
+    
+    
+    def get_version(self, key: Hashable) -> int:
+        """Returns the version of the last write of the given key (0 if it has never been written)."""
+        return self.__versions.get(key, 0)
+    
+    
+    def set(self, key: Hashable, value: Any):
+        """Adds/updates a key-value-pair."""
+        self.update({key: value})
+    
+    
+    def update(self, dictionary: Mapping):
+        """Adds/updates all the given key-value-pairs at once (atomically)."""
+        self.__write(lambda data: data.update(dictionary), dictionary.keys())
+    
+    
+    def delete(self, *keys: Hashable):
+        """Removes the given keys (if they exist)."""
+        self.__write(lambda data: [data.pop(key, None) for key in keys], keys)
+    
+    
+    def clear(self):
+        """Removes all the data."""
+        self.__write(lambda data: data.clear())
+    
+    
+    def wait_for_change(self, keys: Optional[Collection[Hashable]] = None, since: Optional[int] = None,
+                        timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Blocks until one of the given keys is written.
+        :param keys: The keys to wait for. Defaults to all keys.
+        :param since: Only writes after this version count (e.g. the version the caller last saw, so that changes
+                      between two calls are not missed). Defaults to the current version.
+        :param timeout: Maximum number of seconds to wait. Defaults to waiting forever.
+        :return: The version of the store after the change or None if the timeout expired.
+        """
+        
+        with self.__condition:
+            since = self.__version if since is None else since
+            if keys is None:
+                changed = lambda: self.__version > since
+            else:
+                changed = lambda: any(self.__versions.get(key, 0) > since for key in keys)
+            if not self.__condition.wait_for(changed, timeout):
+                return None
+            return self.__version
+    
+    
+    def subscribe(self, callback: Callable[[Mapping, frozenset], None],
+                  keys: Optional[Collection[Hashable]] = None) -> Callable[[], None]:
+        """
+        Calls the given function after every write of one of the given keys (in the writing thread, after the write).
+        :param callback: Is given the snapshot after the write and the written keys.
+        :param keys: The keys to be called for. Defaults to all keys.
+        :return: A function that cancels the subscription.
+        """
+        
+        with self.__condition:
+            subscriber_id = self.__next_subscriber_id
+            self.__next_subscriber_id += 1
+            self.__subscribers[subscriber_id] = (callback, None if keys is None else frozenset(keys))
+        
+        def unsubscribe():
+            with self.__condition:
+                self.__subscribers.pop(subscriber_id, None)
+        
+        return unsubscribe
+    
+    
+    def __write(self, change: Callable[[dict], Any], keys: Optional[Collection[Hashable]] = None):
+        """Applies the given change to a copy of the data, publishes it as the new snapshot (with new versions for the
+        given keys, defaults to all keys of the data before the change) and notifies all consumers of these keys."""
+        
+        with self.__condition:
+            data = dict(self.__data)
+            keys = frozenset(data if keys is None else keys)  # (Taken with the lock, so no other write gets between)
+            change(data)
+            version = self.__version + 1
+            versions = dict(self.__versions)
+            versions.update(dict.fromkeys(keys, version))
+            
+            # Publish (versions first, so that a reader of the new data never sees old versions)
+            self.__versions = MappingProxyType(versions)
+            self.__data = snapshot = MappingProxyType(data)
+            self.__version = version
+            self.__condition.notify_all()
+            
+            subscribers = [callback for callback, subscribed_keys in self.__subscribers.values()
+                           if subscribed_keys is None or not subscribed_keys.isdisjoint(keys)]
+        
+        for callback in subscribers:
+            callback(snapshot, keys)
@@ -1,86 +1,76 @@
 import threading
 
+# Local project imports
+from StateStore import StateStore
 
-def lock_data(func):
-    """Decorator function. Wrapper acquires and releases a threading.Lock (taken from variable ThreadSharedData.lock)
-    to prevent race conditions."""
-    
-    def wrapper(cls, *args):
-        cls.lock.acquire()
-        data = func(cls, *args)
-        cls.lock.release()
-        return data
-    
-    return wrapper
+# For typing
+from typing import Callable, Collection, Hashable, Mapping, Optional
 
 
 class ThreadSharedData:
     """
-    This class is used to share data between threads. Acquiring and releasing a threading.Lock for preventing race
-    conditions is handled by this class and thus does not need to be paid attention to.
+    This class is used to share data between threads (the state of the app, e.g. the window and the competition). It
+    holds one StateStore, so reads are lock-free and return immutable snapshots, writes of several keys are atomic and
+    consumers can wait for changes (see StateStore).
     
     You are not meant to create instances of this class but only use the class itself (all methods are class methods).
+    To hold the state of several independent competitions, create a StateStore per competition instead.
     """
     
-    __shared_data: dict = None    # This holds all the data to share
-    lock: threading.Lock = None    # To prevent race conditions
+    store: StateStore = None    # This holds all the data to share
     
     @classmethod
     def init(cls, data: dict = None, lock: threading.Lock = None):
         """
         Class (!) initialization (mandatory to use this class!).
         :param data: The data to share right away. Defaults to an empty dictionary.
-        :param lock: The threading.Lock object to use. If none is given, a new one is instantiated.
+        :param lock: Not used anymore (the StateStore synchronizes itself), only kept for compatibility.
         """
-        
-        if data is not None:
-            cls.__shared_data = data
-        else:
-            cls.__shared_data = {}
-        
-        if lock is not None:
-            cls.lock = lock
-        else:
-            cls.lock = threading.Lock()
+        cls.store = StateStore(data)
     
     @classmethod
-    @lock_data
-    def get_all(cls):
-        """Returns the whole dictionary of shared data."""
-        return cls.__shared_data
+    def get_all(cls) -> Mapping:
+        """Returns an immutable snapshot of the whole dictionary of shared data."""
+        return cls.store.snapshot()
     
     @classmethod
-    @lock_data
-    def get_keys(cls):
+    def get_keys(cls) -> tuple:
         """Returns all keys of the shared-data-dictionary."""
-        return cls.__shared_data.keys()
+        return cls.store.get_keys()
     
     @classmethod
-    @lock_data
-    def get_values(cls):
+    def get_values(cls) -> tuple:
         """Returns all values of the shared-data-dictionary."""
-        return cls.__shared_data.values()
+        return cls.store.get_values()
     
     @classmethod
-    @lock_data
     def get(cls, key):
         """Returns the value corresponding to the given key of the shared-data-dictionary."""
-        return cls.__shared_data.get(key)
+        return cls.store.get(key)
     
     @classmethod
-    @lock_data
     def set(cls, key, value):
         """Adds/updates a key-value-pair in the shared-data-dictionary."""
-        cls.__shared_data[key] = value
+        cls.store.set(key, value)
 
     @classmethod
-    @lock_data
     def update(cls, dictionary: dict):
-        """Updates the shared-data-dictionary with the given dictionary."""
-        cls.__shared_data.update(dictionary)
+        """Updates the shared-data-dictionary with the given dictionary (atomically)."""
+        cls.store.update(dictionary)
     
     @classmethod
-    @lock_data
     def clear(cls):
         """Clears the shared-data-dictionary."""
-        cls.__shared_data.clear()
+        cls.store.clear()
+    
+    @classmethod
+    def wait_for_change(cls, keys: Optional[Collection[Hashable]] = None, since: Optional[int] = None,
+                        timeout: Optional[float] = None) -> Optional[int]:
+        """Blocks until one of the given keys is written (see StateStore.wait_for_change)."""
+        return cls.store.wait_for_change(keys, since, timeout)
+    
+    @classmethod
+    def subscribe(cls, callback: Callable[[Mapping, frozenset], None],
+                  keys: Optional[Collection[Hashable]] = None) -> Callable[[], None]:
+        """Calls the given function after every write of one of the given keys (see StateStore.subscribe)."""
+        return cls.store.subscribe(callback, keys)
@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import tempfile
+
+# Local project imports
+from settings import APP_DATA_DIR
+
+# For typing
+from typing import Optional
+
+
+THUMBNAIL_DIR = os.path.join(APP_DATA_DIR, 'thumbnails')
+DEFAULT_MAX_BYTES = 512 * 1024**2    # Default byte budget of the store (512 MiB)
+EVICTION_TARGET = 0.9    # Evicting stops at this fraction of the byte budget (so that not every put has to evict)
+INDEX_FILE_NAME = 'index.jsonl'    # Remembers the content hashes of the original files (see ThumbnailStore.get_hash)
+
+
+def lock_store(func):
+    """Decorator function. Wrapper acquires and releases a threading.Lock (taken from variable ThumbnailStore.lock) to
+    prevent race conditions."""
+    
+    def wrapper(cls, *args):
+        with cls.lock:
+            return func(cls, *args)
+    
+    return wrapper
+
+
+class ThumbnailStore:
+    """
+    This class is a persistent (on-disk) cache for encoded images, shared across sessions, so that a folder that is
+    used again does not need any of its (large) original images to be decoded again. It sits behind the ImageCache:
+    memory -> disk -> decoding.
+    
+    The thumbnails are content-addressed: they are stored as '<hash of the original file>_<width>x<height>.png' in
+    the store's directory, so renamed or copied files share their thumbnails and changed files get new ones. Because
+    hashing a file means reading it completely, the hashes are remembered in an index (one JSON line per file: path,
+    size, modification time and hash) and only computed again if the size or the modification time changed.
+    
+    Thumbnails are written atomically (temporary file + os.replace), so a crash never leaves a broken thumbnail behind.
+    If the size of all thumbnails exceeds the byte budget, the least recently used ones (by modification time, which
+    is updated on every hit) are deleted until EVICTION_TARGET of the budget is reached.
+    
+    Like ImageCache, you are not meant to create instances of this class but only use the class itself (all methods
+    are class methods). No initialization is needed (but it can be used to change the directory or the byte budget).
+    """
+    
+    directory: str = THUMBNAIL_DIR
+    max_bytes: int = DEFAULT_MAX_BYTES    # Byte budget
+    size: Optional[int] = None    # Sum of the sizes of all thumbnails (in bytes), None until the directory is scanned
+    hits: int = 0
+    misses: int = 0
+    lock: threading.Lock = threading.Lock()    # To prevent race conditions
+    __hashes: Optional[dict[str, tuple[int, int, str]]] = None    # Path -> (size, mtime, hash), None until loaded
+    
+    @classmethod
+    @lock_store
+    def init(cls, directory: str = THUMBNAIL_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Sets the directory and the byte budget and resets the counters.
+        :param directory: The directory to store the thumbnails (and the index) in. Defaults to THUMBNAIL_DIR.
+        :param max_bytes: The maximum number of bytes of all thumbnails. Defaults to DEFAULT_MAX_BYTES.
+        """
+        
+        cls.directory = directory
+        cls.max_bytes = max_bytes
+        cls.size = None
+        cls.hits = 0
+        cls.misses = 0
+        cls.__hashes = None
+    
+    @classmethod
+    def get(cls, path: str, resolution: tuple[int, int]) -> Optional[bytes]:
+        """Returns the stored thumbnail of the image file at the given path in the given resolution or None if there
+        is none. Also updates the hit/miss counters and marks the thumbnail as recently used."""
+        
+        thumbnail_path = cls.__get_thumbnail_path(path, resolution)
+        try:
+            with open(thumbnail_path, 'rb') as file:
+                data = file.read()
+            os.utime(thumbnail_path)  # Mark as most recently used
+        except OSError:
+            data = None
+        
+        with cls.lock:
+            if data is None:
+                cls.misses += 1
+            else:
+                cls.hits += 1
+        
+        return data
+    
+    @classmethod
+    def put(cls, path: str, resolution: tuple[int, int], data: bytes):
+        """Stores the given thumbnail of the image file at the given path in the given resolution and evicts the least
+        recently used thumbnails if the byte budget is exceeded."""
+        
+        thumbnail_path = cls.__get_thumbnail_path(path, resolution)
+        try:
+            # Write atomically
+            file_descriptor, temp_path = tempfile.mkstemp(dir=cls.directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, thumbnail_path)
+        except OSError as e:
+            print(f"Warning: Could not store thumbnail at {thumbnail_path} ({e})", file=sys.stderr)
+            return
+        
+        cls.__add_size(len(data))
+    
+    @classmethod
+    def get_hash(cls, path: str) -> str:
+        """Returns the hash of the content of the file at the given path (from the index if the file's size and
+        modification time did not change)."""
+        
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with cls.lock:
+            cls.__load_index()
+            entry = cls.__hashes.get(path)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            return entry[2]
+        
+        # Hash the file (in chunks, so that large files do not need to be in memory at once)
+        file_hash = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024**2), b''):
+                file_hash.update(chunk)
+        digest = file_hash.hexdigest()
+        
+        # Remember the hash (appended to the index, later lines overrule earlier ones)
+        with cls.lock:
+            cls.__hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+            try:
+                with open(os.path.join(cls.directory, INDEX_FILE_NAME), 'a', encoding='utf-8') as file:
+                    file.write(json.dumps([path, stat.st_size, stat.st_mtime_ns, digest]) + '\n')
+            except OSError:
+                pass  # The hash just needs to be computed again next time
+        
+        return digest
+    
+    @classmethod
+    @lock_store
+    def stats(cls) -> dict:
+        """Returns the hit/miss counters and the used and available bytes."""
+        return {'hits': cls.hits, 'misses': cls.misses, 'size': cls.size, 'max_bytes': cls.max_bytes}
+    
+    @classmethod
+    def __get_thumbnail_path(cls, path: str, resolution: tuple[int, int]) -> str:
+        """Returns the path of the thumbnail of the image file at the given path in the given resolution."""
+        return os.path.join(cls.directory, f"{cls.get_hash(path)}_{resolution[0]}x{resolution[1]}.png")
+    
+    @classmethod
+    def __load_index(cls):
+        """Loads the index of hashes (if not done yet). If it contains many outdated lines, it is written anew
+        (atomically). Must be called with the lock acquired."""
+        
+        if cls.__hashes is not None:
+            return
+        
+        cls.__hashes = {}
+        try:
+            os.makedirs(cls.directory, exist_ok=True)
+        except OSError:
+            return  # Storing will fail (with a warning), but loading images still works
+        index_path = os.path.join(cls.directory, INDEX_FILE_NAME)
+        lines = 0
+        try:
+            with open(index_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        path, size, mtime, digest = json.loads(line)
+                    except ValueError:  # E.g. an incomplete last line
+                        continue
+                    cls.__hashes[path] = (size, mtime, digest)
+                    lines += 1
+        except FileNotFoundError:
+            return
+        
+        # Compact the index
+        if lines > 2 * len(cls.__hashes):
+            file_descriptor, temp_path = tempfile.mkstemp(dir=cls.directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+                for path, entry in cls.__hashes.items():
+                    file.write(json.dumps([path, *entry]) + '\n')
+            os.replace(temp_path, index_path)
+    
+    @classmethod
+    @lock_store
+    def __add_size(cls, added_bytes: int):
+        """Adds the given number of bytes to the size of all thumbnails and evicts the least recently used thumbnails
+        if the byte budget is exceeded."""
+        
+        if cls.size is None:  # Scan the directory once (this already includes the added thumbnail)
+            cls.size = sum(entry.stat().st_size for entry in os.scandir(cls.directory) if entry.name.endswith('.png'))
+        else:
+            cls.size += added_bytes
+        if cls.size <= cls.max_bytes:
+            return
+        
+        # Evict least recently used thumbnails until the budget is kept
+        entries = [entry for entry in os.scandir(cls.directory) if entry.name.endswith('.png')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        cls.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if cls.size <= EVICTION_TARGET * cls.max_bytes:
+                break
+            try:
+                os.remove(entry.path)
+                cls.size -= entry.stat().st_size
+            except OSError:
+                pass
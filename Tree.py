@@ -1,7 +1,9 @@
+import sys
 from math import log2, ceil
+from array import array
 
 # For typing
-from typing import MutableSequence, Optional, Union
+from typing import Optional, Union, Sequence
 from Competitor import Competitor
 
 
@@ -9,15 +11,22 @@ class Tree:
     """This class is a tree-structure.
     This tree-structure is not a normal tree but is adjusted for the needs of this program (for example the structure:
     in each depth ('layer'), the number of nodes is a mutltiple of 2, starting at 2^0=1 at the root node and
-    incrementing on the way down.)"""
+    incrementing on the way down.)
     
-    def __init__(self, competitors: Optional[MutableSequence[Competitor]] = None, root_node: Optional['Node'] = None):
+    Because of that structure, the tree is stored implicitly in arrays (like a binary heap): the node with index i has
+    its children at 2i+1 and 2i+2 and its parent at (i-1)//2, layer l consists of the indices 2^l-1 to 2^(l+1)-2. The
+    values (competitors) of all nodes are stored in the list self.values, the index of the winning child of every
+    non-leaf node in the array self.winners (-1 if there is no winner yet). For compatibility, single nodes can still
+    be accessed as Node objects (e.g. self.root), which are only views on these arrays."""
+    
+    def __init__(self, competitors: Optional[Sequence[Competitor]] = None, root_node: Optional['Node'] = None):
         """Needs to be given either the competitors or the root node, but cannot be given nothing.
         
         If competitors are given: The tree is newly built (for structure -> see class multi-line comment) and puts
-        gives all the nodes in the deepest layer (or as many as needed) one competitors as a value.
+        gives all the nodes in the deepest layer (or as many as needed) one competitors as a value (from left to right,
+        starting with the last competitor).
         
-        If a node is given, it makes that node the root node and calculates the depth.
+        If a node is given, the subtree below that node is copied (with that node as the root node).
         """
         
         if competitors is not None:
@@ -27,131 +36,205 @@ class Tree:
             self.depth = depth + 1  # +1 because log2 returns 0 for len(competitors)==1 but I want the root to count
                 # as a layer
             
-            # Build tree
-            self.competitors = competitors  # Is only needed for building the tree
-            self.root = self.__build_tree(depth)
-            del self.competitors
+            # Build tree: Only the leaves get values, the remaining leaves stay None
+            self.values: list[Optional[Competitor]] = [None] * (2**self.depth - 1)
+            self.values[2**depth - 1:2**depth - 1 + len(competitors)] = competitors[::-1]
+            self.winners: array = array('q', [-1]) * (2**depth - 1)
         elif root_node is not None:
-            self.depth = self.__find_max_depth(root_node)
-            self.root = root_node
+            self.depth = root_node.tree.depth - root_node.tree.layer_of(root_node.idx)
+            self.values = []
+            self.winners = array('q', [-1]) * (2**(self.depth-1) - 1)
+            
+            # Copy the subtree layer by layer (in layer l below the root node, it consists of 2^l consecutive nodes)
+            first_idx = root_node.idx
+            for layer in range(self.depth):
+                layer_slice = slice(first_idx, first_idx + 2**layer)
+                self.values += root_node.tree.values[layer_slice]
+                if layer < self.depth - 1:
+                    # Winner indices need to be moved to the new positions of the children
+                    old_winners = root_node.tree.winners[layer_slice]
+                    offset = (2*first_idx + 1) - (2**(layer+1) - 1)  # Old minus new index of the first child
+                    self.winners[2**layer - 1:2**(layer+1) - 1] = array('q', [winner - offset if winner >= 0 else -1
+                                                                              for winner in old_winners])
+                first_idx = 2*first_idx + 1
         else:
-            print("Warning: Tree-Initialization: Cannot pass 'None' for both 'competitors' and 'root_node'.")
+            print("Warning: Tree-Initialization: Cannot pass 'None' for both 'competitors' and 'root_node'.",
+                  file=sys.stderr)
     
     
-    def __build_tree(self, depth: int):
-        """Recursively builds the tree. For more details, see the __init__ method."""
-        
-        # === Base case ===
-        if depth == 0:
-            # If is at least one competitor left -> use him as the value, else -> use None
-            try:
-                value = self.competitors.pop()
-            except IndexError:
-                value = None
-            
-            return Node(value=value)
-        
-        # === Non-base case ===
-        node = Node()
-        node.left = self.__build_tree(depth-1)
-        node.left.parent = node
-        node.right = self.__build_tree(depth-1)
-        node.right.parent = node
-        
-        return node
+    # Index functions (all O(1))
+    
+    @staticmethod
+    def parent_of(idx: int) -> int:
+        """Returns the index of the parent of the node with the given index (-1 for the root)."""
+        return (idx - 1) // 2 if idx > 0 else -1
+    
+    
+    @staticmethod
+    def children_of(idx: int) -> tuple[int, int]:
+        """Returns the indices of the left and the right child of the node with the given index."""
+        return 2*idx + 1, 2*idx + 2
+    
+    
+    @staticmethod
+    def layer_of(idx: int) -> int:
+        """Returns the layer of the node with the given index (0 for the root)."""
+        return (idx + 1).bit_length() - 1
     
     
     @staticmethod
-    def __find_max_depth(node: 'Node') -> int:
-        """Finds the depth of the given node."""
+    def layer_range(layer: int) -> range:
+        """Returns the indices of all nodes in the given layer (from left to right)."""
+        return range(2**layer - 1, 2**(layer+1) - 1)
+    
+    
+    @staticmethod
+    def is_descendant(idx: int, ancestor_idx: int) -> bool:
+        """Returns whether the node with index ancestor_idx is a (direct or indirect) parent of the node with index
+        idx."""
         
-        current_node = node
-        depth = 1
+        layers_between = Tree.layer_of(idx) - Tree.layer_of(ancestor_idx)
+        return layers_between > 0 and (idx + 1) >> layers_between == ancestor_idx + 1
+    
+    
+    def is_leaf(self, idx: int) -> bool:
+        """Returns whether the node with the given index is in the deepest layer."""
+        return idx >= len(self.winners)
+    
+    
+    # Winner/loser functions
+    
+    def set_winner(self, idx: int, winner: int):
+        """Sets the winner of the node with the given index to its left (winner=0) or right (winner=1) child and copies
+        the winner's value."""
         
-        # Infinitely go one level deeper until there is no deeper level left
-        while current_node.left is not None:    # This will indeed find the global max depth because in this
-                # implementation of a tree, every route down ends at the same depth.
-            current_node = current_node.left
-            depth += 1
+        winner_idx = 2*idx + 1 + winner
+        self.winners[idx] = winner_idx
+        self.values[idx] = self.values[winner_idx]
+    
+    
+    def winner_of(self, idx: int) -> int:
+        """Returns the index of the winning child of the node with the given index (-1 if there is no winner yet)."""
+        return self.winners[idx]
+    
+    
+    def loser_of(self, idx: int) -> int:
+        """Returns the index of the losing child of the node with the given index (-1 if there is no winner yet)."""
         
-        return depth
+        winner_idx = self.winners[idx]
+        if winner_idx < 0:
+            return -1
+        return winner_idx + 1 if winner_idx % 2 == 1 else winner_idx - 1  # The sibling of the winner
+    
+    
+    # Node views
+    
+    @property
+    def root(self) -> 'Node':
+        return Node(self, 0)
     
     
     def debug_print(self):
         """Prints the tree with its structure and the nodes' values in a more or less good overview."""
         
-        print("R:", self.root.val)  # R for root
-        if self.root.left is not None:
-            self.__debug_helper(self.root.left, 1)
-        if self.root.right is not None:
-            self.__debug_helper(self.root.right, 1)
+        print("R:", self.values[0])  # R for root
+        if not self.is_leaf(0):
+            self.__debug_helper(1, 1)
+            self.__debug_helper(2, 1)
     
     
-    @staticmethod
-    def __debug_helper(node, level):
+    def __debug_helper(self, idx: int, level: int):
         """Helper functions for the debug_print method. Recursively prints the tree structure and the nodes' values."""
         
         print("    " * (level-1), "|--", sep='', end=' ')
-        print("N:", node.val)  # N for node
-        if node.left is not None:
-            Tree.__debug_helper(node.left, level+1)
-        if node.right is not None:
-            Tree.__debug_helper(node.right, level+1)
+        print("N:", self.values[idx])  # N for node
+        if not self.is_leaf(idx):
+            self.__debug_helper(2*idx + 1, level+1)
+            self.__debug_helper(2*idx + 2, level+1)
 
 
 class Node:
     """
-    This class provides the Node objects that a tree of the above class consists of. It contains some extra
-    functionality adjusted for the needs of this program.
+    This class provides Node objects as views on a single node of a tree of the above class. It contains some extra
+    functionality adjusted for the needs of this program. Two Node objects are equal if they view the same node.
     """
     
-    def __init__(self, parent: 'Node' = None, value=None, left=None, right=None):
+    __slots__ = ('tree', 'idx')
+    
+    def __init__(self, tree: Tree, idx: int = 0):
         """
         
-        :param value:
-        :param left:
-        :param right:
+        :param tree: The tree the node belongs to.
+        :param idx: The index of the node in the tree.
         """
         
-        self.parent: 'Node' = parent
-        self.val = value
-        self.left: 'Node' = left
-        self.right: 'Node' = right
-        self.winner: Optional['Node'] = None    # Can later be set to either self.left or self.right
-        self.loser: Optional['Node'] = None    # Can later be set to either self.left or self.right
+        self.tree = tree
+        self.idx = idx
+    
+    
+    def __eq__(self, other):
+        return isinstance(other, Node) and self.tree is other.tree and self.idx == other.idx
+    
+    
+    def __hash__(self):
+        return hash((id(self.tree), self.idx))
+    
+    
+    @property
+    def val(self) -> Optional[Competitor]:
+        return self.tree.values[self.idx]
+    
+    
+    @val.setter
+    def val(self, value: Optional[Competitor]):
+        self.tree.values[self.idx] = value
+    
+    
+    @property
+    def parent(self) -> Optional['Node']:
+        return Node(self.tree, Tree.parent_of(self.idx)) if self.idx > 0 else None
+    
+    
+    @property
+    def left(self) -> Optional['Node']:
+        return Node(self.tree, 2*self.idx + 1) if not self.tree.is_leaf(self.idx) else None
+    
+    
+    @property
+    def right(self) -> Optional['Node']:
+        return Node(self.tree, 2*self.idx + 2) if not self.tree.is_leaf(self.idx) else None
+    
+    
+    @property
+    def winner(self) -> Optional['Node']:
+        """Either self.left or self.right (or None if there is no winner yet)."""
+        if self.tree.is_leaf(self.idx) or self.tree.winner_of(self.idx) < 0:
+            return None
+        return Node(self.tree, self.tree.winner_of(self.idx))
+    
+    
+    @property
+    def loser(self) -> Optional['Node']:
+        """Either self.left or self.right (or None if there is no winner yet)."""
+        if self.tree.is_leaf(self.idx) or self.tree.loser_of(self.idx) < 0:
+            return None
+        return Node(self.tree, self.tree.loser_of(self.idx))
     
     
     def set_winner(self, winner: Union[int, 'Node']):
-        """Sets the node's winner and loser variable to self.left and self.right.
+        """Sets the node's winner and loser to self.left and self.right.
         :param winner: Can be either child of the Node that the method is called on. Can also be an int (0 ->
                        winner = left; 1 -> winner = right)"""
         
-        if isinstance(winner, int):
-            if winner == 0:  # -> winner = left
-                self.winner, self.loser = self.left, self.right
-            else:  # -> winner = right
-                self.winner, self.loser = self.right, self.left
-        else:
-            if winner is self.left:
-                self.winner, self.loser = self.left, self.right
-            else:
-                self.winner, self.loser = self.right, self.left
+        if isinstance(winner, Node):
+            winner = 0 if winner == self.left else 1
+        
+        self.tree.winners[self.idx] = 2*self.idx + 1 + (0 if winner == 0 else 1)
     
     
     def descends_from(self, other: 'Node'):
-        """Recursively checks whether the given Node is a parent of the Node that the method is called on."""
-        
-        # Base case
-        if self.parent is None:  # If arrived at root
-            return False
-        elif self.parent is other:
-            return True
-        
-        # Non-base case
-        if self.parent.descends_from(other):
-            return True
-        else:
-            return False
+        """Checks whether the given Node is a parent of the Node that the method is called on (in O(1))."""
+        return self.tree is other.tree and Tree.is_descendant(self.idx, other.idx)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,138 @@
+"""Headless entry point: Runs a competition on a folder of images without any GUI (and without loading PySimpleGUI or
+OpenCV). The matches are decided by a pluggable evaluator and the ranking is written to stdout or a file.
+
+Example: python cli.py path/to/folder --evaluator name --top 10 --output ranking.txt
+"""
+
+# Dependencies
+import argparse
+import importlib
+import os
+import random
+import sys
+
+# Local project imports
+import data_processing as dp
+from ThreadSharedData import ThreadSharedData as tsd
+
+# For typing
+from typing import Callable, Optional, TextIO
+from Competitor import Competitor
+
+
+# Evaluators ###########################################################################################################
+
+def evaluate_interactive(comp_1: Competitor, comp_2: Competitor) -> Competitor:
+    """Asks the user (via stdin/stderr) to choose the winner."""
+    
+    while True:
+        print(f"1) {comp_1.title}    2) {comp_2.title}", file=sys.stderr)
+        choice = input("Winner (1/2): ").strip()
+        if choice in ('1', '2'):
+            return comp_1 if choice == '1' else comp_2
+
+
+def evaluate_by_name(comp_1: Competitor, comp_2: Competitor) -> Competitor:
+    """The competitor whose title comes first alphabetically wins."""
+    return comp_1 if comp_1.title.lower() <= comp_2.title.lower() else comp_2
+
+
+def evaluate_by_size(comp_1: Competitor, comp_2: Competitor) -> Competitor:
+    """The competitor with the larger image file wins."""
+    return comp_1 if os.path.getsize(comp_1.path) >= os.path.getsize(comp_2.path) else comp_2
+
+
+def evaluate_randomly(comp_1: Competitor, comp_2: Competitor) -> Competitor:
+    """A random competitor wins."""
+    return random.choice((comp_1, comp_2))
+
+
+EVALUATORS = {
+    'interactive': evaluate_interactive,
+    'name'       : evaluate_by_name,
+    'size'       : evaluate_by_size,
+    'random'     : evaluate_randomly
+}
+
+
+def get_evaluator(name: str) -> Callable[[Competitor, Competitor], Competitor]:
+    """Returns the evaluator with the given name (see EVALUATORS) or imports it if given as 'module:function'."""
+    
+    if name in EVALUATORS:
+        return EVALUATORS[name]
+    
+    module_name, _, function_name = name.partition(':')
+    if not function_name:
+        raise ValueError(f"Unknown evaluator '{name}' (use one of {', '.join(EVALUATORS)} or 'module:function').")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+# Running ##############################################################################################################
+
+def write_ranking(ranking: list[Competitor], file: TextIO):
+    """Writes one line per ranked competitor: its title (with the rank in front) and its path, separated by a tab."""
+    for comp in ranking:
+        file.write(f"{comp.title}\t{comp.path}\n")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Parses the command line arguments, runs the competition and writes the ranking. Returns the exit code."""
+    
+    parser = argparse.ArgumentParser(description="Runs a competition on a folder of images without a GUI.")
+    parser.add_argument('folder', help="folder with one image file per competitor")
+    parser.add_argument('--recursive', action='store_true', help="also use the images in all subfolders")
+    parser.add_argument('--check-signatures', action='store_true',
+                        help="skip files that are not really .png/.jpg files (reads the start of every file)")
+    parser.add_argument('--drop-duplicates', action='store_true',
+                        help="only keep one image of every group of near-duplicates (needs NumPy and OpenCV)")
+    parser.add_argument('--evaluator', default='interactive',
+                        help=f"how matches are decided: {', '.join(EVALUATORS)} or 'module:function' "
+                             "(default: interactive)")
+    parser.add_argument('--mode', default='tournament', choices=('tournament', 'merge_insertion', 'scan'),
+                        help="how the ranks after #1 are determined (default: tournament)")
+    parser.add_argument('--top', type=int, default=None, metavar='K', help="only determine the ranks #1 to #K")
+    parser.add_argument('--winner-only', action='store_true', help="only determine the winner")
+    parser.add_argument('--seed', type=int, default=None, help="seed for shuffling (and the random evaluator)")
+    parser.add_argument('--output', default=None, help="file to write the ranking to (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.mode == 'merge_insertion' and args.top is not None:
+        parser.error("--top is not supported by --mode merge_insertion (it always determines all ranks)")
+    if args.top is not None and args.top < 1:
+        parser.error("--top must be at least 1")
+    
+    # Check folder and evaluator
+    path_is_valid, error_message = dp.is_valid_folder(args.folder, args.recursive, args.check_signatures)
+    if not path_is_valid:
+        print(f"Error: {error_message}", file=sys.stderr)
+        return 1
+    try:
+        evaluation_function = get_evaluator(args.evaluator)
+    except (ValueError, ImportError, AttributeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    
+    # Run competition
+    random.seed(args.seed)
+    tsd.init()
+    cm = dp.prepare_competition(args.folder, recursive=args.recursive, check_signature=args.check_signatures,
+                                drop_duplicates=args.drop_duplicates)
+    cm.run_primary(evaluation_function)
+    if not args.winner_only:
+        cm.run_secondary(evaluation_function, mode=args.mode, k=args.top)
+        if len(cm.ranking) == 1 and cm.count > 1 and args.top != 1:  # (The secondary competition was refused)
+            print("Error: Could not determine the ranks after #1.", file=sys.stderr)
+            return 1
+    
+    # Write ranking
+    if args.output is None:
+        write_ranking(cm.ranking, sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            write_ranking(cm.ranking, file)
+    print(f"{cm.comparisons} comparisons", file=sys.stderr)
+    
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
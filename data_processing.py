@@ -1,28 +1,35 @@
 # Dependencies
 import os
-import time
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import partial
 
 # Local project imports
 from Competitor import Competitor
 from CompetitionManager import CompetitionManager
+from DecisionLog import DecisionLog
 from ThreadSharedData import ThreadSharedData as tsd
+from PendingMatch import PendingMatch, CompetitionCancelled
+from folder_scan import iter_image_paths
 
+# For typing
+from typing import Callable, Iterator, Mapping, Optional, Sequence
 
-DELAY_WAIT_FOR_WINNER = 0.1    # Time period after which the 2nd thread should check if a winner has been evaluated
 
+PREPROCESS_BATCH_SIZE = 4    # Number of competitors (two matches) whose images are prepared together
 
-def is_valid_folder(path: str) -> (bool, str):
-    """Checks if the given folder/directory-path is valid (if it contains valid contents)."""
+
+def is_valid_folder(path: str, recursive: bool = False, check_signature: bool = False) -> (bool, str):
+    """Checks if the given folder/directory-path is valid (if it contains at least two image files, other files are
+    ignored). The folder is scanned with folder_scan, so preparing the competition afterwards (prepare_competition)
+    does not need to list it again."""
     
-    file_names = os.listdir(path)
+    if not os.path.isdir(path):
+        return (False, "The folder does not exist.")
     
-    # Check if folder contains only images and count num of image files
-    img_file_counter = 0
-    for file_name in file_names:
-        if not file_name.endswith(('.png', '.jpg', '.jpeg')):
-            return (False, "The folder can only contain image files (.png, .jpg) and nothing else.")
-        else:
-            img_file_counter += 1
+    # Count image files
+    img_file_counter = sum(1 for _ in iter_image_paths(path, recursive, check_signature))
     
     # Check if there are at least 2 image files
     if img_file_counter < 2:
@@ -32,35 +39,155 @@ def is_valid_folder(path: str) -> (bool, str):
     return (True, "")
 
 
-def prepare_competition(path: str, image_resolution: tuple[int, int]) -> CompetitionManager:
+def iter_competitors(path: str,
+                     image_resolution: Optional[tuple[int, int]] = None,
+                     recursive: bool = False,
+                     check_signature: bool = False
+                     ) -> Iterator[Competitor]:
+    """Yields a competitor for every image file of the folder at the given path while the folder is being scanned (see
+    folder_scan.iter_image_paths)."""
+    
+    for image_path in iter_image_paths(path, recursive, check_signature):
+        yield Competitor(path=image_path, img_resolution=image_resolution)
+
+
+def prepare_competition(path: str,
+                        image_resolution: Optional[tuple[int, int]] = None,
+                        decision_log: Optional[DecisionLog] = None,
+                        recursive: bool = False,
+                        check_signature: bool = False,
+                        drop_duplicates: bool = False,
+                        on_duplicates: Optional[Callable[[list[list[Competitor]]], None]] = None
+                        ) -> CompetitionManager:
     """Extracts the competitors' information of the folder at the given path and creates a CompetitionManager
-    object."""
+    object. The image resolution can be left out if the competitors' images are not shown.
+    If a decision log is given, the competitors are put into its logged order (instead of being shuffled) if it
+    belongs to them, and the log is opened for the new competition (see DecisionLog). The decisions of earlier
+    competitions in the folder (DecisionLog.get_history) are turned into ratings, so that matches whose winner they
+    predict confidently are not asked (see ComparisonStore.set_ratings).
+    See folder_scan.iter_image_paths for recursive and check_signature. If drop_duplicates is True, only one competitor
+    of every group of near-duplicate images is kept (see duplicates.remove_duplicates) and the groups (each one with the
+    kept competitor in front) are passed to on_duplicates (defaults to print_duplicates) if there are any."""
     
     # Get competitors
-    file_names = os.listdir(path)
-    competitors = []
-    for f_name in file_names:
-        new_comp = Competitor(path=path+'/'+f_name, img_resolution=image_resolution)
-        competitors.append(new_comp)
+    competitors = list(iter_competitors(path, image_resolution, recursive, check_signature))
+    if drop_duplicates:
+        from duplicates import remove_duplicates  # (Imported here because it needs NumPy and OpenCV)
+        competitors, duplicate_groups = remove_duplicates(competitors)
+        if duplicate_groups:
+            (on_duplicates or print_duplicates)(duplicate_groups)
+    
+    if decision_log is None:
+        return CompetitionManager(competitors)
+    
+    # Resume the logged competition (if there is one)
+    resume = decision_log.restore_order(competitors)
+    competition_manager = CompetitionManager(competitors, shuffle=not resume)
+    decision_log.open(competition_manager.initial_order)
+    if competition_manager.comparison_store is not None:  # The logged matches are then not asked again
+        for winner, loser in decision_log.get_decisions(competition_manager.initial_order):
+            competition_manager.comparison_store.record(winner, loser)
+        
+        # Learn from earlier competitions (imported here because it needs NumPy)
+        history = decision_log.get_history(competition_manager.initial_order)
+        if history:
+            from ratings import fit_ratings, DEFAULT_CONFIDENCE
+            competition_manager.comparison_store.set_ratings(fit_ratings(history), DEFAULT_CONFIDENCE)
+    
+    return competition_manager
+
+
+def print_duplicates(duplicate_groups: list[list[Competitor]]):
+    """Prints (to stderr) which competitors were left out as near-duplicates of which kept one (see
+    prepare_competition)."""
+    
+    for group in duplicate_groups:
+        print(f"Dropped near-duplicates of {group[0].path}: {', '.join(comp.path for comp in group[1:])}",
+              file=sys.stderr)
+
+
+def preprocess_images(competitors: Sequence[Competitor],
+                      resolution: tuple[int, int],
+                      on_progress: Optional[Callable[[int, int], None]] = None,
+                      workers: Optional[int] = None,
+                      batch_size: int = PREPROCESS_BATCH_SIZE
+                      ) -> ThreadPoolExecutor:
+    """
+    Prepares the images of all given competitors (decoding, letterboxing and encoding, see Competitor.prepare_img_data)
+    in batches in a pool of threads (OpenCV releases the GIL, so all CPUs are used). The images are prepared in the
+    given order, so if it is the order of the matches, the first match can start as soon as the first batch is ready
+    (get_img_data waits for images that are being prepared).
+    :param competitors: The competitors (e.g. in the order of the matches).
+    :param resolution: The resolution to prepare the images in (all registered resolutions are prepared anyway).
+    :param on_progress: Is called (from the worker threads) with the number of prepared images and the number of all
+                        images whenever a batch is done.
+    :param workers: The number of threads to use. Defaults to the number of CPUs.
+    :param batch_size: The number of competitors whose images are letterboxed together.
+    :return: The executor (shut it down with cancel_futures=True to stop preparing).
+    """
     
-    return CompetitionManager(competitors)
+    executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix='preprocess')
+    done_count = 0
+    lock = threading.Lock()
+    
+    def count_done(batch_count: int, future: Future):
+        nonlocal done_count
+        if future.cancelled():
+            return
+        with lock:  # (Also keeps the progress reports in order)
+            done_count += batch_count
+            if on_progress is not None:
+                on_progress(done_count, len(competitors))
+    
+    for start in range(0, len(competitors), batch_size):
+        batch = competitors[start:start + batch_size]
+        future = executor.submit(Competitor.prepare_img_data, batch, resolution)
+        future.add_done_callback(partial(count_done, len(batch)))
+    
+    return executor
 
 
-def evaluate_winner(comp_1: Competitor, comp_2: Competitor) -> Competitor:
+def evaluate_winner(comp_1: Competitor, comp_2: Competitor, timeout: Optional[float] = None) -> Competitor:
     """This will only be called by the 2nd thread. It evaluates the winner of the current match by indirectly waiting
-    for the user input."""
+    for the user input (the PendingMatch is sent to the GUI thread with the match, which decides it once it is shown;
+    it is also shared with key 'match' so that it can be cancelled, see watch_cancellation).
+    Raises CompetitionCancelled if the competition was cancelled (see cancel_competition) and TimeoutError if no
+    winner was chosen within the given timeout (in seconds)."""
+    
+    if tsd.get('cancelled'):
+        raise CompetitionCancelled()
+    
+    # Move the prefetcher's cursor (if images are prepared in advance)
+    prefetcher = tsd.get('prefetcher')
+    if prefetcher is not None:
+        prefetcher.advance((comp_1, comp_2))
+    
+    # Share match (so that it is cancelled if the competition is, see watch_cancellation)
+    match = PendingMatch(comp_1, comp_2)
+    tsd.set('match', match)
     
-    # Send event & value to window
-    tsd.get('window').write_event_value(key='-T_NEW_COMPS-', value=(comp_1, comp_2))
-    # Share competitors
-    tsd.set('comps', (comp_1, comp_2))
+    # Send event & value to window (clicks only decide the match once it is shown, see event_handlers.clicked_image)
+    tsd.get('window').write_event_value(key='-T_NEW_COMPS-', value=match)
     
     # Wait for the user to choose a winner
-    winner = None
-    while winner is None:
-        time.sleep(DELAY_WAIT_FOR_WINNER)
-        winner = tsd.get('winner')
-    # Reset winner
-    tsd.set('winner', None)
-    
-    return winner
+    return match.wait(timeout)
+
+
+def cancel_competition():
+    """Cancels the currently running competition: the match that is waited for and all following calls of
+    evaluate_winner raise CompetitionCancelled (so that the thread running the competition can end). The match is
+    cancelled by the subscription of watch_cancellation."""
+    tsd.set('cancelled', True)
+
+
+def watch_cancellation() -> Callable[[], None]:
+    """Subscribes to the shared keys 'cancelled' and 'match' (see cancel_competition and evaluate_winner), so that the
+    shared match is cancelled once the competition is cancelled, no matter which of the two keys is written last (the
+    subscriber always gets the snapshot after the last write). Returns the function that ends the subscription."""
+    
+    def cancel_match(data: Mapping, keys: frozenset):
+        match: Optional[PendingMatch] = data.get('match')
+        if data.get('cancelled') and match is not None:
+            match.cancel()
+    
+    return tsd.subscribe(cancel_match, keys=('cancelled', 'match'))
@@ -0,0 +1,205 @@
+"""Finds near-duplicate images (e.g. the same photo as .jpg and as .png, or burst shots) before the bracket is built,
+since every duplicate costs extra matches. Every image gets a perceptual hash (image_processing.dhash_batch) and
+images whose hashes differ in at most max_distance bits are grouped (multi-index hashing, see
+find_near_duplicates). The hashes are cached in APP_DATA_DIR (keyed by path, size and modification time), so only new
+or changed images are decoded again."""
+
+# Dependencies
+import os
+import json
+import numpy as np
+
+# Local project imports
+from settings import APP_DATA_DIR
+
+# For typing
+from typing import Optional, Sequence
+from Competitor import Competitor
+
+
+DEFAULT_MAX_DISTANCE = 6    # Maximum number of differing bits (of 64) of the hashes of near-duplicates
+HEADER_BYTES = 256 * 1024    # Number of bytes read to find the size of an image (see image_processing.read_image_size)
+HASH_CACHE_PATH = os.path.join(APP_DATA_DIR, 'dhashes_v3.jsonl')    # One JSON line per image: path, size, mtime, hash
+
+_hash_cache: Optional[dict[str, tuple[int, int, int]]] = None    # Path -> (size, mtime, hash), None until loaded
+
+
+def get_hashes(paths: Sequence[str], workers: Optional[int] = None) -> np.ndarray:
+    """Returns the dHashes (see image_processing.dhash_batch) of the image files at the given paths, from the cache if
+    the files did not change."""
+    
+    global _hash_cache
+    if _hash_cache is None:
+        _hash_cache = {}
+        try:
+            with open(HASH_CACHE_PATH, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        path, size, mtime, hash_value = json.loads(line)
+                    except ValueError:  # E.g. an incomplete last line
+                        continue
+                    _hash_cache[path] = (size, mtime, hash_value)
+        except FileNotFoundError:
+            pass
+    
+    # Look up the cached hashes
+    hashes = np.empty(len(paths), np.uint64)
+    missing = []    # (index, absolute path, stat) of the images that need to be hashed
+    for i, path in enumerate(paths):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = _hash_cache.get(path)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            hashes[i] = entry[2]
+        else:
+            missing.append((i, path, stat))
+    if not missing:
+        return hashes
+    
+    # Hash the others (imported here so that competitions without duplicate detection do not need to load OpenCV)
+    from image_processing import dhash_batch
+    new_hashes = dhash_batch([path for _, path, _ in missing], workers)
+    hashes[[i for i, _, _ in missing]] = new_hashes
+    
+    # Remember them (appended to the cache, later lines overrule earlier ones)
+    lines = []
+    for (_, path, stat), hash_value in zip(missing, new_hashes.tolist()):
+        _hash_cache[path] = (stat.st_size, stat.st_mtime_ns, hash_value)
+        lines.append(json.dumps([path, stat.st_size, stat.st_mtime_ns, hash_value]) + '\n')
+    try:
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        with open(HASH_CACHE_PATH, 'a', encoding='utf-8') as file:
+            file.writelines(lines)
+    except OSError:
+        pass  # The hashes just need to be computed again next time
+    
+    return hashes
+
+
+def find_near_duplicates(hashes: np.ndarray, max_distance: int = DEFAULT_MAX_DISTANCE) -> list[list[int]]:
+    """
+    Returns the groups (lists of indices, at least two each) of the given 64-bit hashes that are near-duplicates: A
+    hash is in the group of every hash within max_distance bits of it (and so on, transitively).
+    Instead of comparing all pairs, multi-index hashing is used: The hashes are cut into max_distance+1 chunks. Two
+    hashes that differ in at most max_distance bits are equal in at least one chunk, so only hashes that share a chunk
+    (found by sorting by that chunk) are compared, all in vectorized NumPy operations.
+    :param hashes: One uint64 per image.
+    :param max_distance: The maximum number of differing bits.
+    :return:
+    """
+    
+    # Equal hashes are handled once
+    unique_hashes, inverse = np.unique(np.asarray(hashes, np.uint64), return_inverse=True)
+    parents = np.arange(len(unique_hashes))  # Union-find forest of the unique hashes
+    
+    # Candidate pairs: hashes that are equal in one of the chunks
+    chunk_count = min(max_distance + 1, 64)
+    bounds = np.linspace(0, 64, chunk_count + 1).astype(np.uint64)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        keys = (unique_hashes >> start) & np.uint64((1 << int(end - start)) - 1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        
+        # Compare every hash with the following ones that have the same key (offset by offset)
+        offset = 1
+        while offset < len(order):
+            same_key = np.flatnonzero(sorted_keys[offset:] == sorted_keys[:-offset])
+            if len(same_key) == 0:
+                break
+            left, right = order[same_key], order[same_key + offset]
+            close = _count_bits(unique_hashes[left] ^ unique_hashes[right]) <= max_distance
+            for i, j in zip(left[close].tolist(), right[close].tolist()):
+                _union(parents, i, j)
+            offset += 1
+    
+    # Collect the groups (of the original indices)
+    roots = np.array([_find(parents, i) for i in range(len(unique_hashes))], np.intp)[inverse.ravel()]
+    order = np.argsort(roots, kind='stable')
+    groups = np.split(order, np.flatnonzero(np.diff(roots[order])) + 1)
+    
+    return [group.tolist() for group in groups if len(group) > 1]
+
+
+def remove_duplicates(competitors: Sequence[Competitor],
+                      max_distance: int = DEFAULT_MAX_DISTANCE,
+                      workers: Optional[int] = None
+                      ) -> tuple[list[Competitor], list[list[Competitor]]]:
+    """
+    Keeps one competitor of every group of near-duplicate images (see find_near_duplicates): the one with the most
+    pixels (most likely the original, e.g. rather than a downscaled copy), preferring .jpg over .png (which is
+    likely a converted copy) and then the larger file.
+    :param competitors:
+    :param max_distance: See find_near_duplicates.
+    :param workers: Number of threads to decode the images with (see image_processing.dhash_batch).
+    :return: The kept competitors (in their given order) and the groups of dropped competitors (each one with the kept
+             competitor in front).
+    """
+    
+    hashes = get_hashes([comp.path for comp in competitors], workers)
+    dropped = set()
+    groups = []
+    for group in find_near_duplicates(hashes, max_distance):
+        group.sort(key=lambda i: _get_original_key(competitors[i].path))
+        dropped.update(group[1:])
+        groups.append([competitors[i] for i in group])
+    
+    return [comp for i, comp in enumerate(competitors) if i not in dropped], groups
+
+
+def _get_original_key(path: str) -> tuple:
+    """Returns a sort key for the image file at the given path that puts the most likely original of near-duplicates
+    first (see remove_duplicates)."""
+    
+    from image_processing import read_image_size
+    width, height = read_image_size(np.fromfile(path, np.uint8, count=HEADER_BYTES)) or (0, 0)
+    return -width * height, path.lower().endswith('.png'), -os.path.getsize(path), path
+
+
+def _count_bits(values: np.ndarray) -> np.ndarray:
+    """Returns the number of set bits of every given uint64."""
+    
+    if hasattr(np, 'bitwise_count'):  # (NumPy 2)
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _find(parents: np.ndarray, i: int) -> int:
+    """Returns the root of the given index in the union-find forest (and shortens the path to it)."""
+    
+    root = i
+    while parents[root] != root:
+        root = parents[root]
+    while parents[i] != root:
+        parents[i], i = root, parents[i]
+    
+    return root
+
+
+def _union(parents: np.ndarray, i: int, j: int):
+    """Merges the trees of the given indices in the union-find forest."""
+    
+    root_i, root_j = _find(parents, i), _find(parents, j)
+    if root_i != root_j:
+        parents[max(root_i, root_j)] = min(root_i, root_j)
+
+
+if __name__ == '__main__':
+    # Benchmark: hashing all images of the given folder (without the cache) and grouping them, or, without a folder,
+    # grouping 50k hashes (45k random ones and 5k near-duplicates of them)
+    import sys
+    import time
+    if len(sys.argv) > 1:
+        from folder_scan import iter_image_paths
+        from image_processing import dhash_batch
+        _paths = list(iter_image_paths(sys.argv[1]))
+        _start = time.perf_counter()
+        _hashes = dhash_batch(_paths)
+        print(f"hashed {len(_paths)} images in {time.perf_counter() - _start:.1f}s on {os.cpu_count()} CPUs")
+    else:
+        _rng = np.random.default_rng(0)
+        _hashes = _rng.integers(0, 2**64, 45000, np.uint64, endpoint=False)
+        _flips = np.uint64(1) << _rng.integers(0, 64, 5000).astype(np.uint64)
+        _hashes = np.concatenate([_hashes, _hashes[_rng.choice(45000, 5000, replace=False)] ^ _flips])
+    _start = time.perf_counter()
+    _groups = find_near_duplicates(_hashes)
+    print(f"{len(_groups)} groups in {time.perf_counter() - _start:.2f}s")
@@ -8,6 +8,9 @@ import cv2
 import window_layouts as winlay
 import data_processing as dp
 from ThreadSharedData import ThreadSharedData as tsd
+from Prefetcher import Prefetcher
+from DecisionLog import DecisionLog
+from PendingMatch import PendingMatch, CompetitionCancelled
 
 # For typing
 from typing import Optional
@@ -44,6 +47,18 @@ def popup_folder_location() -> Optional[str]:
             print(error_message)  # TODO: Remove later?
 
 
+def popup_duplicates(duplicate_groups: list[list[Competitor]]):
+    """Shows a popup with the competitors that were left out as near-duplicates of other ones (see
+    dp.prepare_competition), so that the user can check them (different images can have very similar hashes)."""
+    
+    lines = []
+    for group in duplicate_groups:
+        lines.append(f"Kept: {group[0].path}")
+        lines += [f"    Left out: {comp.path}" for comp in group[1:]]
+    left_out_count = sum(len(group) - 1 for group in duplicate_groups)
+    sg.popup_scrolled("\n".join(lines), title=f"Left out {left_out_count} duplicate images", size=(100, 20))
+
+
 def get_ranking_images(window: sg.Window) -> list[sg.Image]:
     """Returns the sg.Image objects of the sub-layout with key '-COL_END_2-'."""
     return [window[f'-COMP_{key_suffix}-'] for key_suffix in ('LEFT', 'MID', 'RIGHT')]
@@ -55,6 +70,21 @@ def get_ranking_titles(window: sg.Window) -> list[sg.Text]:
     return [window[f'-RANKS_TITLE_{key_suffix}-'] for key_suffix in ('LEFT', 'MID', 'RIGHT')]
 
 
+def show_ranks(window: sg.Window, competitors: list[Competitor]):
+    """Shows the given (up to three) competitors' images and titles in the sub-layout with key '-COL_END_2-'."""
+    
+    images = get_ranking_images(window)
+    titles = get_ranking_titles(window)
+    for comp, img, title in zip(competitors, images, titles):
+        img.update(data=comp.get_img_data(winlay.IMG_RES_RANKS), visible=True)
+        title.update(comp.title)
+    
+    # Hide the images that are not needed (if fewer than three ranks were determined)
+    for img, title in zip(images[len(competitors):], titles[len(competitors):]):
+        img.update(visible=False)
+        title.update('')
+
+
 # Start layout events ##################################################################################################
 
 def choose_folder(window: sg.Window, event: str, values: dict):
@@ -67,18 +97,41 @@ def choose_folder(window: sg.Window, event: str, values: dict):
         # Add path to window metadata (so that if the user later wants to save the ranking, we know the path)
         window.metadata = folder_path
         
-        # Create competition manager and add to shared data
-        competition_manager = dp.prepare_competition(folder_path, winlay.IMG_RES_MATCH)
-        tsd.set('cm', competition_manager)
+        # Create competition manager and add to shared data (resumes the competition if it was interrupted before)
+        decision_log = DecisionLog(folder_path)
+        competition_manager = dp.prepare_competition(folder_path, winlay.IMG_RES_MATCH, decision_log,
+                                                     drop_duplicates=bool(values.get('-DEDUPLICATE-')),
+                                                     on_duplicates=popup_duplicates)
+        
+        # Prepare the images of upcoming matches in the background
+        prefetcher = Prefetcher(winlay.IMG_RES_MATCH)
+        
+        tsd.update({'cm': competition_manager, 'decision_log': decision_log, 'prefetcher': prefetcher})  # (At once)
+        
+        # Prepare the images of all competitors in the background (if chosen), in the order of the matches (the tree's
+        # leaves hold the competitors in reversed order)
+        if values.get('-PREPROCESS-'):
+            def report_progress(done_count: int, count: int):
+                window.write_event_value(key='-T_PREPROCESS_PROGRESS-', value=(done_count, count))
+            preprocessor = dp.preprocess_images(competition_manager.initial_order[::-1], winlay.IMG_RES_MATCH,
+                                                on_progress=report_progress)
+            tsd.set('preprocessor', preprocessor)
         
         # Create new thread that runs the competition
         def run_competition():
             """Target for the new thread. Runs the competition and sends event to the window when the winner
              of the whole competitions has been determined."""
-            competition_manager.run_primary(evaluation_function=dp.evaluate_winner)
+            try:
+                competition_manager.run_primary(evaluation_function=decision_log.wrap(dp.evaluate_winner),
+                                                on_layer_start=prefetcher.schedule)
+            except CompetitionCancelled:  # If the window was closed
+                return
+            finally:
+                prefetcher.shutdown()
+                tsd.set('prefetcher', None)
             window.write_event_value(key='-T_WINNER-', value=tsd.get('cm').winner)  # Signal the window that there is a
                     # winner
-        t = threading.Thread(target=run_competition, daemon=True)
+        t = threading.Thread(target=run_competition)
         t.start()
         
         tsd.set('new_thread', t)
@@ -95,15 +148,20 @@ def competitors_per_text(window: sg.Window, event: str, values: dict):
 # Main layout events ###################################################################################################
 
 def clicked_image(window: sg.Window, event: str, values: dict):
-    """Indirectly signals the 2nd thread that a winner has been determined by updating the value with key 'winner'
-    in the shared-data-dictionary of the ThreadSharedData class."""
+    """Signals the 2nd thread that a winner has been determined by deciding the PendingMatch that is shown right now
+    (key 'shown_match' in the shared-data-dictionary of the ThreadSharedData class, see thread_new_competitors). Clicks
+    that come before the next match is shown therefore never decide it."""
+    
+    match: Optional[PendingMatch] = tsd.get('shown_match')
+    if match is None:  # If clicked before the first match was shown
+        return
     
     if event.endswith('L-'):  # Clicked on left image
-        winner = tsd.get('comps')[0]
+        winner = match.competitors[0]
     else:  # Clicked on left image
-        winner = tsd.get('comps')[1]
+        winner = match.competitors[1]
     
-    tsd.set('winner', winner)
+    match.decide(winner)  # Ignored if the shown match has already been decided (e.g. the 2nd click of a double click)
 
 
 # End layout events ####################################################################################################
@@ -111,19 +169,30 @@ def clicked_image(window: sg.Window, event: str, values: dict):
 # End layout 1
 
 def run_secondary(window: sg.Window, event: str, values: dict):
-    """Creates a new thread to run the secondary competition (where every rank after #1 is determined).
-    Also switches to main layout."""
+    """Creates a new thread to run the secondary competition (where every rank after #1 is determined, or only the
+    ranks up to the number given in the input with key '-RANKS_COUNT-'). Also switches to main layout."""
+    
+    # Get the number of ranks to determine (all if nothing valid is given)
+    try:
+        k = int(values['-RANKS_COUNT-'])
+    except (KeyError, ValueError):
+        k = None
     
     # Create new thread that determines the remaining ranks
     def determine_remaining_ranks():
         """Target for the new thread. Runs the secondary competition and sends event to the window when all the
         remaining ranks have been determined."""
         cm = tsd.get('cm')
-        cm.run_secondary(evaluation_function=dp.evaluate_winner)
+        try:
+            cm.run_secondary(evaluation_function=tsd.get('decision_log').wrap(dp.evaluate_winner), k=k)
+        except CompetitionCancelled:  # If the window was closed
+            return
         window.write_event_value(key='-T_FINISHED_SECONDARY-', value=None)
-    t = threading.Thread(target=determine_remaining_ranks, daemon=True)
+    t = threading.Thread(target=determine_remaining_ranks)
     t.start()
     
+    tsd.set('new_thread', t)
+    
     # Switch sub layout
     window['-COL_END_1-'].update(visible=False)
     window['-COL_MAIN-'].update(visible=True)
@@ -132,19 +201,17 @@ def run_secondary(window: sg.Window, event: str, values: dict):
 # End layout 2
 
 rank_idx = 0    # Rank index of competitor shown on the left
-image_data_buffer = []    # Temporarily store image data so not all images need to be recalculated
 
 
 def ranks_previous(window: sg.Window, event: str, values: dict):
     """Updates the shown competitors when the user clicked the left-arrow button (in the end_2 sub-layout)."""
     
     global rank_idx
-    global image_data_buffer
     cm: CompetitionManager = tsd.get('cm')
     
     # Check if next-button should be shown
-    if rank_idx+2 == cm.count-1:  # (This is before rank_idx is updated) If before, there was no lower (= numerically
-            # higher) rank to show
+    if rank_idx+2 == len(cm.ranking)-1:  # (This is before rank_idx is updated) If before, there was no lower
+            # (= numerically higher) rank to show
         window['-B_RANKS_NEXT-'].update(visible=True)
     
     # Update rank index and check if previous-button should be hidden
@@ -152,32 +219,14 @@ def ranks_previous(window: sg.Window, event: str, values: dict):
     if rank_idx == 0:
         window['-B_RANKS_PREV-'].update(visible=False)
     
-    # Prepare image updates
-    images = get_ranking_images(window)
-    image_data_buffer.pop()  # Remove last element because the right-most element gets thrown away
-    
-    # For the last two images, show the image of its left neighbor
-    for i in range(1, 3):
-        # images[i].update(data=images[i-1].Data)    Unfortunately, this somehow does not work
-        images[i].update(data=image_data_buffer[i-1])
-    
-    # For the left image, show next higher (= numerically lower) ranked competitor
-    next_comp_to_show: Competitor = cm.ranking[rank_idx]
-    img_data = next_comp_to_show.get_img_data(winlay.IMG_RES_RANKS)
-    images[0].update(data=img_data)
-    image_data_buffer.insert(0, img_data)  # Add data to buffer
-    
-    # Update titles
-    titles = get_ranking_titles(window)
-    for title, comp in zip(titles, cm.ranking[rank_idx:rank_idx+3]):
-        title.update(comp.title)
+    # Show competitors (images that were shown before are served from the image cache)
+    show_ranks(window, cm.ranking[rank_idx:rank_idx+3])
 
 
 def ranks_next(window: sg.Window, event: str, values: dict):
     """Updates the shown competitors when the user clicked the right-arrow button (in the end_2 sub-layout)."""
     
     global rank_idx
-    global image_data_buffer
     cm: CompetitionManager = tsd.get('cm')
     
     # Check if previous-button should be shown
@@ -187,34 +236,18 @@ def ranks_next(window: sg.Window, event: str, values: dict):
     
     # Update rank index and check if next-button should be hidden
     rank_idx += 1
-    if rank_idx+3 == cm.count:
+    if rank_idx+3 == len(cm.ranking):
         window['-B_RANKS_NEXT-'].update(visible=False)
     
-    # Prepare image updates
-    images = get_ranking_images(window)
-    image_data_buffer.pop(0)  # Remove first element because the left-most element gets thrown away
-    
-    # For the first two images, show the image of its right neighbor
-    for i in range(2):
-        # images[i].update(data=images[i+1].Data)    Unfortunately, this somehow does not work
-        images[i].update(data=image_data_buffer[i])
-    
-    # For the right image, show next lower (= numerically higher) ranked competitor
-    next_comp_to_show: Competitor = cm.ranking[rank_idx+2]
-    img_data = next_comp_to_show.get_img_data(winlay.IMG_RES_RANKS)
-    images[-1].update(data=img_data)
-    image_data_buffer.append(img_data)    # Add data to buffer
-
-    # Update titles
-    titles = get_ranking_titles(window)
-    for title, comp in zip(titles, cm.ranking[rank_idx:rank_idx+3]):
-        title.update(comp.title)
+    # Show competitors (images that were shown before are served from the image cache)
+    show_ranks(window, cm.ranking[rank_idx:rank_idx+3])
 
 
 def save(window: sg.Window, event: str, values: dict):
     """Creates a new folder/directory (at the location where the competitors are saved). Copies all the competitors'
     files to that folder but with their new titles where their ranks are in front of there title.
-    (Ex.: old title: 'xXDemonSlayer69_ProHDXx' -> new title: '#4 xXDemonSlayer69_ProHDXx')"""
+    (Ex.: old title: 'xXDemonSlayer69_ProHDXx' -> new title: '#4 xXDemonSlayer69_ProHDXx')
+    Unranked competitors (if only the top ranks were determined) keep their old titles."""
     
     path = window.metadata  # The path to where the competitors are saved (-> where we want to create the new folder)
     path += "/Competition Ranking"  # Add the new directory name
@@ -227,10 +260,14 @@ def save(window: sg.Window, event: str, values: dict):
         return
     
     # Add competitor images
-    for comp in tsd.get('cm').ranking:
+    cm: CompetitionManager = tsd.get('cm')
+    for comp in cm.ranking + cm.unranked:
         filepath = path + '/' + comp.title + comp.file_extension
         img = cv2.imread(comp.path)
         cv2.imwrite(filepath, img)
+    
+    # The competition is finished, so it does not need to be resumed anymore
+    tsd.get('decision_log').delete()
 
 
 # Thread events ########################################################################################################
@@ -239,21 +276,43 @@ def thread_new_competitors(window: sg.Window, event: str, values: dict):
     """Shows the competitors of the new match in the main sub-layout."""
     
     # Get competitors
+    match: PendingMatch = values['-T_NEW_COMPS-']
     comp_1: Competitor
     comp_2: Competitor
-    comp_1, comp_2 = values['-T_NEW_COMPS-']
+    comp_1, comp_2 = match.competitors
     
     # Show round information
     round_info_func = tsd.get('round_info_func')
     window['-ROUND_INFO-'].update(value=round_info_func())
     
-    # Show competitors
-    window['-IMG_L-'].update(data=comp_1.get_img_data(winlay.IMG_RES_MATCH))
-    window['-IMG_R-'].update(data=comp_2.get_img_data(winlay.IMG_RES_MATCH))
+    # Show competitors (if the images are being prepared in the background, wait for them instead of decoding again)
+    prefetcher: Optional[Prefetcher] = tsd.get('prefetcher')
+    if prefetcher is not None:
+        window['-IMG_L-'].update(data=prefetcher.get_img_data(comp_1))
+        window['-IMG_R-'].update(data=prefetcher.get_img_data(comp_2))
+    else:
+        window['-IMG_L-'].update(data=comp_1.get_img_data(winlay.IMG_RES_MATCH))
+        window['-IMG_R-'].update(data=comp_2.get_img_data(winlay.IMG_RES_MATCH))
     
     # Show titles
     window['-TITLE_L-'].update(comp_1.title)
     window['-TITLE_R-'].update(comp_2.title)
+    
+    # From now on, clicks decide this match (see clicked_image)
+    tsd.set('shown_match', match)
+
+
+def thread_preprocess_progress(window: sg.Window, event: str, values: dict):
+    """Shows how many images have been prepared in advance (see data_processing.preprocess_images)."""
+    
+    done_count, count = values['-T_PREPROCESS_PROGRESS-']
+    if done_count < count:
+        window['-PREPROCESS_INFO-'].update(f"Preparing images: {done_count}/{count}")
+    else:
+        window['-PREPROCESS_INFO-'].update('')
+        if tsd.get('preprocessor') is not None:
+            tsd.get('preprocessor').shutdown(wait=False)
+            tsd.set('preprocessor', None)
 
 
 def thread_winner(window: sg.Window, event: str, values: dict):
@@ -274,28 +333,15 @@ def thread_winner(window: sg.Window, event: str, values: dict):
 
 
 def thread_finished_secondary(window: sg.Window, event: str, values: dict):
-    """Switches to the end_2 sub-layout and shows the first three places."""
-    
-    global image_data_buffer
-    
-    # Get competitors, images and text fields
-    top_three_comps: list[Competitor] = tsd.get('cm').ranking[:3]
-    images: list[sg.Image] = get_ranking_images(window)
-    titles: list[sg.Text] = get_ranking_titles(window)
+    """Switches to the end_2 sub-layout and shows the first three places (or fewer if fewer ranks were
+    determined)."""
     
-    # Show images and put image data in buffer
-    for comp, img, title in zip(top_three_comps, images, titles):
-        # Show image and add data to buffer
-        img_data = comp.get_img_data(winlay.IMG_RES_RANKS)
-        img.update(data=img_data)
-        image_data_buffer.append(img_data)
-        
-        # Show title
-        title.update(comp.title)
+    # Show first three places
+    show_ranks(window, tsd.get('cm').ranking[:3])
     
     # Handle next/previous button visibility
     window['-B_RANKS_PREV-'].update(visible=False)
-    if tsd.get('cm').count <= 3:
+    if len(tsd.get('cm').ranking) <= 3:
         window['-B_RANKS_NEXT-'].update(visible=False)
     
     # Switch sub layout
@@ -0,0 +1,150 @@
+"""Streaming scan of competition folders: A single os.scandir pass per directory that yields the image files as they are
+found (so competitors can be created while the scan is still running), optionally recursing into subfolders and
+checking the files' magic bytes. Directory listings are cached (in memory and in APP_DATA_DIR) keyed by the
+directory's modification time, which changes whenever an entry is added, removed or renamed, so scanning an unchanged
+directory again only costs one os.stat instead of listing (possibly 100k) entries on slow storage. Listings of
+directories that changed within the last MTIME_GRANULARITY seconds are not cached, since a change in the same tick of
+the (possibly coarse) modification time would go unnoticed."""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+
+# Local project imports
+from settings import APP_DATA_DIR
+
+# For typing
+from typing import Iterator, Optional
+
+
+LISTING_DIR = os.path.join(APP_DATA_DIR, 'listings')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+IMAGE_SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff')    # Magic bytes of .png and .jpg files
+MIN_CACHED_ENTRIES = 1000    # Listings of smaller directories are only cached in memory (listing them is cheap)
+MTIME_GRANULARITY = 2    # Coarsest resolution of modification times in seconds (e.g. FAT, some network file systems)
+
+_listings: dict[str, tuple[int, list[str], list[str]]] = {}    # Directory -> (mtime, file names, subdirectory names)
+
+
+def iter_image_paths(path: str, recursive: bool = False, check_signature: bool = False) -> Iterator[str]:
+    """
+    Yields the paths of all image files (see IMAGE_EXTENSIONS) in the folder at the given path while scanning it.
+    Hidden entries (starting with '.') are skipped.
+    :param path: The folder.
+    :param recursive: Whether to include the images in all subfolders as well (after the ones of the folder itself).
+    :param check_signature: Whether to only yield files that really start like a .png/.jpg file (reads the first
+                            bytes of every file, so it costs one open per file).
+    :return:
+    """
+    
+    directories = [path.rstrip('/') or '/']
+    while directories:
+        directory = directories.pop()
+        subdirectories = []
+        for name, is_directory in _iter_entries(directory):
+            if name.startswith('.'):
+                continue
+            entry_path = directory + '/' + name
+            if is_directory:
+                subdirectories.append(entry_path)
+            elif name.lower().endswith(IMAGE_EXTENSIONS) and (not check_signature or has_image_signature(entry_path)):
+                yield entry_path
+        
+        if recursive:
+            directories += reversed(sorted(subdirectories))  # (So they are scanned in alphabetical order)
+
+
+def has_image_signature(path: str) -> bool:
+    """Returns whether the file at the given path starts with the magic bytes of a .png or .jpg file."""
+    
+    try:
+        with open(path, 'rb') as file:
+            return file.read(8).startswith(IMAGE_SIGNATURES)
+    except OSError:
+        return False
+
+
+def _iter_entries(directory: str) -> Iterator[tuple[str, bool]]:
+    """Yields (name, whether it is a directory) of all entries of the given directory, from the cached listing if the
+    directory did not change since, else while scanning it (and caches the new listing afterwards)."""
+    
+    mtime = os.stat(directory).st_mtime_ns
+    listing = _get_cached_listing(directory, mtime)
+    if listing is not None:
+        file_names, subdirectory_names = listing
+        yield from ((name, False) for name in file_names)
+        yield from ((name, True) for name in subdirectory_names)
+        return
+    
+    # Scan (yielding the entries right away)
+    file_names, subdirectory_names = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                is_directory = entry.is_dir()  # (Usually known from the scan itself, without a stat)
+            except OSError:
+                continue
+            (subdirectory_names if is_directory else file_names).append(entry.name)
+            yield entry.name, is_directory
+    
+    # Cache the listing (if the directory did not change during the scan and its modification time is old enough that
+    # a change after the scan would change it, see MTIME_GRANULARITY)
+    if os.stat(directory).st_mtime_ns == mtime and time.time_ns() - mtime >= MTIME_GRANULARITY * 10**9:
+        _store_listing(directory, mtime, file_names, subdirectory_names)
+
+
+def _get_cached_listing(directory: str, mtime: int) -> Optional[tuple[list[str], list[str]]]:
+    """Returns the cached (file names, subdirectory names) of the given directory if they belong to the given
+    modification time, else None."""
+    
+    listing = _listings.get(directory)
+    if listing is None:
+        try:
+            with open(_get_listing_path(directory), 'r', encoding='utf-8') as file:
+                listing = tuple(json.load(file))
+            _listings[directory] = listing
+        except (OSError, ValueError):
+            return None
+    
+    if listing[0] != mtime:
+        return None
+    return listing[1], listing[2]
+
+
+def _store_listing(directory: str, mtime: int, file_names: list[str], subdirectory_names: list[str]):
+    """Caches the given listing of the given directory in memory and (for large directories) on disk (atomically)."""
+    
+    _listings[directory] = (mtime, file_names, subdirectory_names)
+    if len(file_names) + len(subdirectory_names) < MIN_CACHED_ENTRIES:
+        return
+    
+    try:
+        os.makedirs(LISTING_DIR, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=LISTING_DIR, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+            json.dump([mtime, file_names, subdirectory_names], file)
+        os.replace(temp_path, _get_listing_path(directory))
+    except OSError as e:
+        print(f"Warning: Could not cache the listing of {directory} ({e})", file=sys.stderr)
+
+
+def _get_listing_path(directory: str) -> str:
+    """Returns the path of the file the listing of the given directory is cached in."""
+    return os.path.join(LISTING_DIR, hashlib.sha1(os.path.abspath(directory).encode()).hexdigest() + '.json')
+
+
+if __name__ == '__main__':
+    # Benchmark: first scan vs. rescan of a folder with 100k (empty) image files
+    _folder = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    if len(sys.argv) == 1:
+        for _i in range(100000):
+            open(os.path.join(_folder, f'{_i}.jpg'), 'wb').close()
+        _mtime = time.time_ns() - MTIME_GRANULARITY * 10**9  # (Else the new folder is too fresh to be cached)
+        os.utime(_folder, ns=(_mtime, _mtime))
+    for _label in ('scan', 'rescan (cached)'):
+        _start = time.perf_counter()
+        _count = sum(1 for _ in iter_image_paths(_folder))
+        print(f"{_label}: {_count} images in {(time.perf_counter() - _start) * 1000:.0f}ms")
@@ -0,0 +1,267 @@
+# Dependencies
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# For typing
+from typing import Iterable, Optional, Sequence
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}    # Start-of-frame markers (they contain the size)
+REDUCED_DECODE_FLAGS = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+DHASH_SIZE = 8    # dHash: Every row of the (DHASH_SIZE+1)xDHASH_SIZE grayscale image gives DHASH_SIZE bits (-> 64 bits)
+
+ENCODINGS = ('ppm', 'png-fast', 'png')    # See encode_image
+PNG_FAST_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 0]
+if hasattr(cv2, 'IMWRITE_PNG_FILTER'):  # (Newer OpenCV versions) Without filtering, level 0 is little more than a copy
+    PNG_FAST_PARAMS += [cv2.IMWRITE_PNG_FILTER, cv2.IMWRITE_PNG_FILTER_NONE]
+
+
+def fit_size(image_size: tuple[int, int], resolution: tuple[int, int]) -> tuple[int, int]:
+    """Returns the largest size (width, height) with the aspect ratio of the given image size (width, height) that
+    fits into the given resolution (width, height)."""
+    
+    width, height = image_size
+    target_width, target_height = resolution
+    scale = min(target_width / width, target_height / height)
+    
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def letterbox(image: np.ndarray, resolution: tuple[int, int], out: np.ndarray = None) -> np.ndarray:
+    """Resizes the given image to fit into the given resolution (width, height) while keeping its aspect ratio and
+    pads the remaining area (top/bottom or left/right) with black.
+    
+    :param image: The image (as returned by cv2.imread/cv2.imdecode).
+    :param resolution: The (width, height) of the result.
+    :param out: Optional preallocated array of shape (height, width, channels) to write the result into.
+    :return: The letterboxed image (out if given).
+    """
+    
+    height, width = image.shape[:2]
+    target_width, target_height = resolution
+    
+    # Resize (keeping the aspect ratio)
+    new_width, new_height = fit_size((width, height), resolution)
+    if (new_width, new_height) != (width, height):
+        interpolation = cv2.INTER_AREA if new_width < width else cv2.INTER_LINEAR    # INTER_AREA for shrinking
+        image = cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+    
+    # Nothing to pad
+    if out is None and (new_width, new_height) == (target_width, target_height):
+        return image
+    
+    # Copy the image into the middle of the (black) output
+    if out is None:
+        out = np.zeros((target_height, target_width) + image.shape[2:], image.dtype)
+    else:
+        out[...] = 0
+    top, left = (target_height - new_height) // 2, (target_width - new_width) // 2
+    out[top:top+new_height, left:left+new_width] = image
+    
+    return out
+
+
+def read_image_size(file_bytes: np.ndarray) -> Optional[tuple[int, int]]:
+    """Returns the size (width, height) of the given encoded .png or .jpg image by only reading its header (without
+    decoding it) or None if it is neither or the size cannot be found."""
+    
+    data = memoryview(file_bytes)
+    
+    # PNG: The size is at the beginning of the first chunk (IHDR)
+    if data[:8] == PNG_SIGNATURE and len(data) >= 24:
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    
+    # JPEG: Go through the segments until the start-of-frame segment
+    if data[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # Fill byte
+            pos += 1
+        elif marker in JPEG_SOF_MARKERS:
+            return int.from_bytes(data[pos+7:pos+9], 'big'), int.from_bytes(data[pos+5:pos+7], 'big')
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Segments without a length
+            pos += 2
+        else:
+            pos += 2 + int.from_bytes(data[pos+2:pos+4], 'big')
+    
+    return None
+
+
+def get_decode_flag(file_bytes: np.ndarray, resolutions: Sequence[tuple[int, int]]) -> int:
+    """
+    Returns the flag for cv2.imdecode to decode the given encoded image with: For .jpg images that are much larger
+    than needed, the largest reduction (1/2, 1/4 or 1/8, which the JPEG decoder can apply while decoding) whose result
+    still is at least as large as the image letterboxed to each of the given resolutions, else cv2.IMREAD_COLOR.
+    Both orientations are checked because the decoder might rotate the image (EXIF orientation).
+    """
+    
+    image_size = read_image_size(file_bytes)
+    if image_size is None or memoryview(file_bytes)[:8] == PNG_SIGNATURE:  # PNG cannot be decoded reduced
+        return cv2.IMREAD_COLOR
+    
+    width, height = image_size
+    for factor, flag in REDUCED_DECODE_FLAGS.items():  # From the largest to the smallest reduction
+        reduced_width, reduced_height = -(-width // factor), -(-height // factor)  # (Rounded up)
+        large_enough = True
+        for resolution in resolutions:
+            fitted_width, fitted_height = fit_size((width, height), resolution)
+            rotated_width, rotated_height = fit_size((height, width), resolution)
+            if (fitted_width > reduced_width or fitted_height > reduced_height
+                    or rotated_width > reduced_height or rotated_height > reduced_width):
+                large_enough = False
+        if large_enough:
+            return flag
+    
+    return cv2.IMREAD_COLOR
+
+
+def encode_image(image: np.ndarray, encoding: str = 'png') -> bytes:
+    """
+    Encodes the given (BGR) image in a format that PySimpleGUI-Images (Tk) can show (they don't support .jpg).
+    :param image: The image.
+    :param encoding: 'png' -> compressed .png (for anything that is written to disk).
+                     'png-fast' -> .png without compression (bigger but faster to encode and to decode).
+                     'ppm' -> uncompressed binary .ppm (just a header in front of the pixels), the fastest for images
+                              that are only shown (Tk decodes it directly).
+    :return:
+    """
+    
+    if encoding == 'ppm':
+        height, width = image.shape[:2]
+        return f"P6\n{width} {height}\n255\n".encode() + cv2.cvtColor(image, cv2.COLOR_BGR2RGB).tobytes()
+    elif encoding == 'png-fast':
+        return cv2.imencode('.png', image, PNG_FAST_PARAMS)[1].tobytes()
+    elif encoding == 'png':
+        return cv2.imencode('.png', image)[1].tobytes()
+    raise ValueError(f"Unknown encoding '{encoding}' (use one of {', '.join(ENCODINGS)}).")
+
+
+def load_img_data(path: str, resolution: tuple[int, int], encoding: str = 'png') -> bytes:
+    """Reads the image file at the given path, letterboxes it to the given resolution (width, height) and returns it
+    encoded (see encode_image). Everything happens in memory."""
+    return encode_image(letterbox_pyramid(path, [resolution])[tuple(resolution)], encoding)
+
+
+def decode_image(path: str, resolutions: Sequence[tuple[int, int]]) -> np.ndarray:
+    """Reads and decodes the image file at the given path (BGR) to be letterboxed to the given resolutions (large .jpg
+    images are reduced while decoding, see get_decode_flag)."""
+    
+    file_bytes = np.fromfile(path, np.uint8)
+    return cv2.imdecode(file_bytes, get_decode_flag(file_bytes, resolutions))
+
+
+def letterbox_pyramid(path: str, resolutions: Iterable[tuple[int, int]]) -> dict[tuple[int, int], np.ndarray]:
+    """
+    Like load_img_data, but for several resolutions at once and without encoding: The image file is only read and
+    decoded once (reduced if it is a large .jpg, see get_decode_flag) and the resolutions are produced from the largest
+    to the smallest one, each resized from the previous (larger) one instead of from the full-size original.
+    :param path: The path of the image file.
+    :param resolutions: The resolutions (width, height) to produce (duplicates are only produced once).
+    :return: Resolution -> letterboxed image.
+    """
+    
+    resolutions = list(set(map(tuple, resolutions)))
+    img = decode_image(path, resolutions)
+    image_size = (img.shape[1], img.shape[0])
+    
+    # Resize (keeping the aspect ratio) & pad, from the largest to the smallest resolution
+    images = {}
+    source = img
+    for resolution in sorted(resolutions, key=lambda res: fit_size(image_size, res), reverse=True):
+        width, height = fit_size(image_size, resolution)
+        if width > source.shape[1] or height > source.shape[0]:  # (Only if the aspect ratio is not the same)
+            source = img
+        
+        letterboxed = letterbox(source, resolution)
+        images[resolution] = letterboxed
+        
+        # The next (smaller) resolution is resized from this one (without the padding)
+        top, left = (resolution[1] - height) // 2, (resolution[0] - width) // 2
+        source = letterboxed[top:top+height, left:left+width]
+    
+    return images
+
+
+def letterbox_batch(images: Sequence[np.ndarray], resolution: tuple[int, int]) -> np.ndarray:
+    """Letterboxes all the given images (see letterbox) into a single preallocated array of shape
+    (len(images), height, width, 3). All images need to have three channels (BGR)."""
+    
+    target_width, target_height = resolution
+    out = np.empty((len(images), target_height, target_width, 3), np.uint8)
+    for image, image_out in zip(images, out):
+        letterbox(image, resolution, out=image_out)
+    
+    return out
+
+
+def read_dhash_image(path: str) -> np.ndarray:
+    """Returns the (DHASH_SIZE+1)xDHASH_SIZE grayscale image that the dHash of the image file at the given path is
+    computed from (see dhash_batch). Every image is reduced to 1/8 of its size first (by far large enough): .jpg images
+    are decoded like that, .png images are decoded fully and reduced to the same size with INTER_AREA. Both are
+    decoded in color and converted to grayscale the same way, so that a .jpg and a .png copy of it get (almost) the
+    same hash (IMREAD_GRAYSCALE would take the luma channel of a .jpg directly, which differs from converting BGR)."""
+    
+    file_bytes = np.fromfile(path, np.uint8)
+    is_png = memoryview(file_bytes)[:8] == PNG_SIGNATURE
+    img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR if is_png else cv2.IMREAD_REDUCED_COLOR_8)
+    if img is None:
+        raise ValueError(f"Cannot decode the image file at {path}.")
+    if is_png:
+        height, width = img.shape[:2]
+        img = cv2.resize(img, (-(-width // 8), -(-height // 8)), interpolation=cv2.INTER_AREA)  # (Rounded up like .jpg)
+    
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(img, (DHASH_SIZE + 1, DHASH_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def dhash_batch(paths: Sequence[str], workers: Optional[int] = None) -> np.ndarray:
+    """
+    Returns the difference hashes (dHash, a perceptual hash: one bit per pair of horizontally neighboring pixels of a
+    tiny grayscale version, 1 if the left one is brighter) of the image files at the given paths. Similar images
+    (e.g. a re-encoded copy or a burst shot) have hashes with a small Hamming distance.
+    The images are decoded in a thread pool (OpenCV releases the GIL) and all hashes are computed at once from the
+    stacked tiny images.
+    :param paths:
+    :param workers: Number of threads. Defaults to the ThreadPoolExecutor default.
+    :return: One uint64 per path.
+    """
+    
+    if len(paths) == 0:
+        return np.empty(0, np.uint64)
+    
+    with ThreadPoolExecutor(workers) as executor:
+        images = np.stack(list(executor.map(read_dhash_image, paths)))
+    
+    bits = images[:, :, 1:] < images[:, :, :-1]  # Shape: (len(paths), DHASH_SIZE, DHASH_SIZE)
+    return np.packbits(bits.reshape(len(paths), -1), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+if __name__ == '__main__':
+    # Benchmark: encoding cost per displayed image (325x325)
+    import time
+    _image = letterbox(np.random.default_rng(0).integers(0, 256, (1000, 1500, 3), np.uint8), (325, 325))
+    _image = cv2.GaussianBlur(_image, (0, 0), 5)  # (Photo-like, noise does not compress)
+    for _encoding in ENCODINGS:
+        _start = time.perf_counter()
+        for _ in range(200):
+            _data = encode_image(_image, _encoding)
+        print(f"{_encoding}: {(time.perf_counter() - _start) / 200 * 1000:.2f}ms per image, {len(_data)} bytes")
+    
+    # Check: a .jpg and its .png copy (e.g. left behind by an earlier conversion) need to get (almost) the same dHash
+    import os
+    import glob
+    import tempfile
+    _folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'screenshots')
+    with tempfile.TemporaryDirectory() as _temp_dir:
+        for _jpg_path in sorted(glob.glob(os.path.join(_folder, '*.jpg'))):
+            _png_path = os.path.join(_temp_dir, 'copy.png')
+            cv2.imwrite(_png_path, cv2.imread(_jpg_path))
+            _distance = bin(int(np.bitwise_xor.reduce(dhash_batch([_jpg_path, _png_path])))).count('1')
+            print(f"{os.path.basename(_jpg_path)}: .jpg/.png dHash distance {_distance}")
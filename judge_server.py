@@ -0,0 +1,87 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# For typing
+from MatchScheduler import MatchScheduler
+
+
+DEFAULT_PORT = 8765
+
+
+def make_server(scheduler: MatchScheduler, host: str = 'localhost', port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """
+    Returns an HTTP server (not started yet, use serve_forever) that lets remote judges decide the matches of the given
+    scheduler:
+    GET /match -> 200 with {"lease": <id>, "left": {"title", "path"}, "right": {...}} (claims a match),
+                  204 if no match is ready right now, 410 if the competition is finished.
+    POST /decide with {"lease": <id>, "winner": 0 (left) | 1 (right)} -> 200 if the decision counts, 409 if the match
+                  has been decided already (e.g. by another judge) or the lease is unknown.
+    POST /release with {"lease": <id>} -> 200 (gives the match back to the other judges).
+    """
+    
+    leases = {}    # Lease id -> lease (to translate the winner side into the competitor)
+    
+    class JudgeRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/match':
+                return self.__respond(404)
+            
+            lease = scheduler.claim(timeout=0)
+            if lease is None:
+                return self.__respond(410 if scheduler.finished else 204)
+            leases[lease.id] = lease
+            left_c, right_c = lease.competitors  # 'c' -> competitor
+            self.__respond(200, {'lease': lease.id,
+                                 'left': {'title': left_c.title, 'path': getattr(left_c, 'path', None)},
+                                 'right': {'title': right_c.title, 'path': getattr(right_c, 'path', None)}})
+        
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                lease = leases[body['lease']]
+            except (ValueError, KeyError, TypeError):
+                return self.__respond(409 if self.path == '/decide' else 400)
+            
+            if self.path == '/decide':
+                if body.get('winner') not in (0, 1):
+                    return self.__respond(400)
+                decided = scheduler.decide(lease.id, lease.competitors[body['winner']])
+                leases.pop(lease.id, None)
+                self.__respond(200 if decided else 409)
+            elif self.path == '/release':
+                scheduler.release(lease.id)
+                leases.pop(lease.id, None)
+                self.__respond(200)
+            else:
+                self.__respond(404)
+        
+        def __respond(self, status: int, body: dict = None):
+            data = b'' if body is None else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def log_message(self, format, *args):
+            pass  # No output for every request
+    
+    return ThreadingHTTPServer((host, port), JudgeRequestHandler)
+
+
+if __name__ == '__main__':
+    # Manual test: serve a competition of the images in the given folder
+    import sys
+    import threading
+    import data_processing as dp
+    from ThreadSharedData import ThreadSharedData as tsd
+    
+    tsd.init()
+    _cm = dp.prepare_competition(sys.argv[1])
+    _scheduler = MatchScheduler(_cm)
+    _server = make_server(_scheduler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    print(f"Judges can connect to http://localhost:{DEFAULT_PORT}/match")
+    _scheduler.wait()
+    _server.shutdown()
+    print(f"Winner: {_cm.winner.title} ({_cm.comparisons} matches)")
@@ -4,8 +4,8 @@ import PySimpleGUI as sg
 # Local project imports
 import window_layouts as winlay
 import event_handlers as eh
+import data_processing as dp
 from ThreadSharedData import ThreadSharedData as tsd
-from Competitor import Competitor
 
 
 window = sg.Window("Competition Simulator",
@@ -17,23 +17,26 @@ window = sg.Window("Competition Simulator",
 # Set up shared data
 tsd.init()
 tsd.set('window', window)
-tsd.set('winner', None)
+tsd.set('match', None)
+tsd.set('shown_match', None)
+dp.watch_cancellation()
 
 # (For the event loop) Dict with key-function-pairs to avoid if-elif-else structure in event loop
 event_handling_functions = {
-    '-B_FOLDER-'            : eh.choose_folder,
-    '-B_TEXT-'              : eh.competitors_per_text,
-    '-B_RUN_SECONDARY-'     : eh.run_secondary,
-    '-B_RANKS_PREV-'        : eh.ranks_previous,
-    '-B_RANKS_NEXT-'        : eh.ranks_next,
-    '-B_SAVE-'              : eh.save,
+    '-B_FOLDER-'             : eh.choose_folder,
+    '-B_TEXT-'               : eh.competitors_per_text,
+    '-B_RUN_SECONDARY-'      : eh.run_secondary,
+    '-B_RANKS_PREV-'         : eh.ranks_previous,
+    '-B_RANKS_NEXT-'         : eh.ranks_next,
+    '-B_SAVE-'               : eh.save,
     
-    '-T_NEW_COMPS-'         : eh.thread_new_competitors,
-    '-T_WINNER-'            : eh.thread_winner,
-    '-T_FINISHED_SECONDARY-': eh.thread_finished_secondary,
+    '-T_NEW_COMPS-'          : eh.thread_new_competitors,
+    '-T_PREPROCESS_PROGRESS-': eh.thread_preprocess_progress,
+    '-T_WINNER-'             : eh.thread_winner,
+    '-T_FINISHED_SECONDARY-' : eh.thread_finished_secondary,
     
-    '-IMG_L-'               : eh.clicked_image,
-    '-IMG_R-'               : eh.clicked_image
+    '-IMG_L-'                : eh.clicked_image,
+    '-IMG_R-'                : eh.clicked_image
 }
 
 # Run event loop
@@ -48,9 +51,14 @@ while True:
         except KeyError:
             print(f"Warning: Unsupported event: '{event}'")
 
-# Clean up
-try:
-    Competitor.delete_files()
-except FileNotFoundError:    # If exited before end
-    print("Warning: Could not delete file")
+# Clean up: End the thread running the competition (if there is one)
+dp.cancel_competition()
+if tsd.get('new_thread') is not None:
+    tsd.get('new_thread').join()
+if tsd.get('prefetcher') is not None:
+    tsd.get('prefetcher').shutdown()
+if tsd.get('preprocessor') is not None:
+    tsd.get('preprocessor').shutdown(wait=False, cancel_futures=True)
+if tsd.get('decision_log') is not None:
+    tsd.get('decision_log').close()
 window.close()
@@ -0,0 +1,38 @@
+"""Consumers of match streams: generators that yield every match (pair of competitors) that needs to be evaluated and
+expect the winner to be sent back (e.g. CompetitionManager.iter_primary/iter_secondary and the iter_ methods of
+RankingEngine). The same stream can be evaluated by a plain evaluation function (run_matches) or awaited with a
+coroutine (run_matches_async), so that one event loop can drive many competitions at once without a thread for each."""
+
+# For typing
+from typing import Awaitable, Callable, Generator, TypeVar
+from Competitor import Competitor
+
+
+Result = TypeVar('Result')
+
+
+def run_matches(matches: Generator[tuple[Competitor, Competitor], Competitor, Result],
+                evaluation_function: Callable[[Competitor, Competitor], Competitor]
+                ) -> Result:
+    """Evaluates every match of the given stream with the given evaluation function and returns what the stream
+    returns."""
+    
+    try:
+        match = next(matches)
+        while True:
+            match = matches.send(evaluation_function(*match))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_matches_async(matches: Generator[tuple[Competitor, Competitor], Competitor, Result],
+                            evaluation_function: Callable[[Competitor, Competitor], Awaitable[Competitor]]
+                            ) -> Result:
+    """Like run_matches, but awaits the given (async) evaluation function for every match."""
+    
+    try:
+        match = next(matches)
+        while True:
+            match = matches.send(await evaluation_function(*match))
+    except StopIteration as stop:
+        return stop.value
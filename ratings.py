@@ -0,0 +1,110 @@
+"""Estimates per-competitor strengths (Bradley-Terry model: P(i beats j) = p_i / (p_i + p_j)) from recorded match
+decisions. The decisions can come from many competitions (sessions, folders), as long as the same competitor gets the
+same key everywhere (e.g. its path). The strengths can be turned into Elo ratings (to_elo) or into win probabilities
+for the simulation (simulation.probabilities_from_ratings)."""
+
+# Dependencies
+import numpy as np
+
+# For typing
+from typing import Callable, Hashable, Iterable, Optional
+
+
+DEFAULT_PRIOR = 0.5    # Virtual wins and losses of every competitor against an average competitor (regularization)
+DEFAULT_CONFIDENCE = 0.9    # Minimum predicted win probability to skip asking (see ComparisonStore.set_ratings)
+
+
+def fit_bradley_terry(winners: np.ndarray,
+                      losers: np.ndarray,
+                      count: Optional[int] = None,
+                      prior: float = DEFAULT_PRIOR,
+                      max_iterations: int = 1000,
+                      tolerance: float = 1e-6
+                      ) -> np.ndarray:
+    """
+    Fits Bradley-Terry strengths with the MM algorithm (Hunter 2004). Every iteration is a handful of vectorized
+    passes over the decisions (np.bincount), so fitting millions of decisions takes seconds.
+    :param winners: Indices of the winners (one per decision).
+    :param losers: Indices of the losers (one per decision).
+    :param count: Number of competitors. Defaults to the highest index + 1.
+    :param prior: Number of virtual wins and losses of every competitor against a competitor of strength 1. Makes the
+                  strengths of competitors that never (or always) won finite. Must be positive if there are such
+                  competitors.
+    :param max_iterations: Maximum number of MM iterations.
+    :param tolerance: The iteration stops when no strength changes by more than this factor (relative).
+    :return: The strengths (normalized to a geometric mean of 1).
+    """
+    
+    winners, losers = np.asarray(winners, np.intp), np.asarray(losers, np.intp)
+    if count is None:
+        count = int(max(winners.max(initial=-1), losers.max(initial=-1))) + 1
+    
+    wins = np.bincount(winners, minlength=count) + prior
+    strengths = np.ones(count)
+    for _ in range(max_iterations):
+        # Denominator: sum over all games of i of 1 / (p_i + p_opponent) (plus the virtual games)
+        inverse_sums = 1 / (strengths[winners] + strengths[losers])
+        denominators = (np.bincount(winners, inverse_sums, minlength=count)
+                        + np.bincount(losers, inverse_sums, minlength=count)
+                        + 2 * prior / (strengths + 1))
+        new_strengths = wins / denominators
+        new_strengths /= np.exp(np.log(new_strengths).mean())  # Normalize (the model is invariant to scaling)
+        
+        converged = np.max(np.abs(new_strengths / strengths - 1)) < tolerance
+        strengths = new_strengths
+        if converged:
+            break
+    
+    return strengths
+
+
+def fit_ratings(decisions: Iterable[tuple[Hashable, Hashable]],
+                key: Optional[Callable[[Hashable], Hashable]] = None,
+                **kwargs
+                ) -> dict[Hashable, float]:
+    """
+    Fits Bradley-Terry strengths (see fit_bradley_terry) from (winner, loser) pairs.
+    :param decisions: The (winner, loser) pairs, e.g. ComparisonStore.decisions of one or more competitions.
+    :param key: Maps a competitor to the key that identifies it across competitions (e.g. lambda c: c.path).
+                Defaults to the competitor itself.
+    :param kwargs: Passed to fit_bradley_terry.
+    :return: Key -> strength.
+    """
+    
+    indices: dict[Hashable, int] = {}
+    winners, losers = [], []
+    for winner, loser in decisions:
+        if key is not None:
+            winner, loser = key(winner), key(loser)
+        winners.append(indices.setdefault(winner, len(indices)))
+        losers.append(indices.setdefault(loser, len(indices)))
+    
+    strengths = fit_bradley_terry(np.array(winners, np.intp), np.array(losers, np.intp), len(indices), **kwargs)
+    
+    return dict(zip(indices, strengths.tolist()))
+
+
+def win_probability(strength_1: float, strength_2: float) -> float:
+    """Returns the probability that the competitor with strength_1 beats the one with strength_2."""
+    return strength_1 / (strength_1 + strength_2)
+
+
+def to_elo(strengths: np.ndarray, base: float = 1500) -> np.ndarray:
+    """Converts Bradley-Terry strengths to Elo ratings (a strength ratio of 10 corresponds to 400 Elo points)."""
+    return base + 400 * np.log10(strengths)
+
+
+if __name__ == '__main__':
+    # Benchmark: 10k competitors, 1M decisions
+    import time
+    _rng = np.random.default_rng(0)
+    _true_strengths = _rng.lognormal(size=10_000)
+    _pairs = _rng.integers(0, 10_000, (1_000_000, 2))
+    _pairs = _pairs[_pairs[:, 0] != _pairs[:, 1]]
+    _first_wins = _rng.random(len(_pairs)) < _true_strengths[_pairs[:, 0]] / _true_strengths[_pairs].sum(axis=1)
+    _winners = np.where(_first_wins, _pairs[:, 0], _pairs[:, 1])
+    _losers = np.where(_first_wins, _pairs[:, 1], _pairs[:, 0])
+    _start = time.perf_counter()
+    _strengths = fit_bradley_terry(_winners, _losers, 10_000)
+    print(f"Fitted 10k competitors from {len(_pairs)} decisions in {time.perf_counter() - _start:.2f}s")
+    print("correlation of log strengths:", np.corrcoef(np.log(_strengths), np.log(_true_strengths))[0, 1])
@@ -0,0 +1,5 @@
+import os
+
+
+# Directory for data the program keeps between sessions (e.g. the decision logs of interrupted competitions)
+APP_DATA_DIR = os.path.join(os.path.expanduser('~'), '.tournament-simulator')
@@ -0,0 +1,206 @@
+"""Vectorized Monte Carlo simulation of brackets: Instead of a single bracket decided by clicks, many brackets are
+simulated at once from pairwise win probabilities. The brackets have the same layout as the ones of CompetitionManager
+and Tree (shuffled competitors in the leftmost leaves, padded with byes to the next power of two). Every layer is
+resolved for all simulations at once with NumPy array operations."""
+
+# Dependencies
+from math import log2, ceil
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import numpy as np
+
+# For typing
+from typing import Optional, Sequence
+
+
+CHUNK_ELEMENTS = 2**22    # Number of leaves (of all brackets) simulated at once (limits the memory usage)
+
+
+def probabilities_from_ratings(ratings: Sequence[float], elo: bool = False) -> np.ndarray:
+    """
+    Returns the matrix of pairwise win probabilities (P[i, j] -> probability that i beats j) for the given ratings.
+    :param ratings: Per-competitor strengths. Bradley-Terry strengths (positive, P[i, j] = r_i / (r_i + r_j)) or, if
+                    elo is True, Elo ratings (P[i, j] = 1 / (1 + 10^((R_j - R_i) / 400))).
+    :param elo: Whether the ratings are Elo ratings.
+    :return:
+    """
+    
+    ratings = np.asarray(ratings, np.float64)
+    if elo:
+        return 1 / (1 + 10**((ratings[None, :] - ratings[:, None]) / 400))
+    
+    return ratings[:, None] / (ratings[:, None] + ratings[None, :])
+
+
+def rounds_count(competitors_count: int) -> int:
+    """Returns the number of rounds (layers with matches) of a bracket for the given number of competitors."""
+    return ceil(log2(competitors_count))
+
+
+def simulate_counts(probabilities: np.ndarray,
+                    simulations: int,
+                    rng: np.random.Generator,
+                    shuffle: bool = True,
+                    chunk_size: Optional[int] = None
+                    ) -> np.ndarray:
+    """
+    Simulates the given number of brackets and returns how often each competitor reached each round.
+    :param probabilities: Matrix of pairwise win probabilities (P[i, j] -> probability that i beats j).
+    :param simulations: Number of brackets to simulate.
+    :param rng: The random number generator to use.
+    :param shuffle: Whether to shuffle the competitors for every bracket (like CompetitionManager does). If False,
+                    every bracket has the layout of Tree(list(range(n))).
+    :param chunk_size: Number of brackets simulated at once. Defaults to as many as have CHUNK_ELEMENTS leaves.
+    :return: Integer array of shape (n, rounds + 1): counts[i, r] -> number of brackets in which competitor i reached
+             round r (r = 0 -> took part, r = rounds -> won the whole bracket).
+    """
+    
+    n = len(probabilities)
+    rounds = rounds_count(n)
+    leaves = 2**rounds
+    dtype = np.int16 if n < 2**15 else np.int32
+    counts = np.zeros((n, rounds + 1), np.int64)
+    counts[:, 0] = simulations
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // leaves)
+    
+    # Fixed layout (see Tree): the leaves from left to right get the competitors from last to first
+    fixed_order = np.arange(n - 1, -1, -1, dtype=dtype)
+    flat_probabilities = np.ascontiguousarray(probabilities, np.float64).ravel()  # P[i, j] -> flat[i*n + j]
+    
+    done = 0
+    while done < simulations:
+        size = min(chunk_size, simulations - done)
+        done += size
+        
+        # Fill the leaves: competitors in the first n leaves, byes (-1) in the remaining ones
+        slots = np.full((size, leaves), -1, dtype)
+        if shuffle:
+            slots[:, :n] = np.argsort(rng.random((size, n), np.float32), axis=1)  # Random permutation per bracket
+        else:
+            slots[:, :n] = fixed_order
+        
+        # Resolve one layer after another for all brackets at once
+        for r in range(1, rounds + 1):
+            left, right = slots[:, 0::2], slots[:, 1::2]
+            has_left, has_right = left >= 0, right >= 0
+            
+            # Random outcome of every match (only matters if there are two competitors)
+            match_idx = np.maximum(left, 0).astype(np.intp) * n + np.maximum(right, 0)
+            left_wins = rng.random(left.shape, np.float32) < flat_probabilities[match_idx]
+            slots = np.where(has_left & (left_wins | ~has_right), left, right)
+            
+            # Count who reached this round
+            reached = slots[slots >= 0]
+            counts[:, r] += np.bincount(reached, minlength=n)
+    
+    return counts
+
+
+def simulate(probabilities: np.ndarray,
+             simulations: int,
+             shuffle: bool = True,
+             seed: Optional[int] = None,
+             chunk_size: Optional[int] = None
+             ) -> np.ndarray:
+    """
+    Simulates the given number of brackets and returns the probability of each competitor to reach each round.
+    :param probabilities: Matrix of pairwise win probabilities (P[i, j] -> probability that i beats j), e.g. from
+                          probabilities_from_ratings.
+    :param simulations: Number of brackets to simulate.
+    :param shuffle: Whether to shuffle the competitors for every bracket (like CompetitionManager does).
+    :param seed: Seed of the random number generator.
+    :param chunk_size: See simulate_counts.
+    :return: Array of shape (n, rounds + 1): reach[i, r] -> probability that competitor i reaches round r
+             (reach[:, -1] -> probability to win the whole bracket).
+    """
+    
+    probabilities = np.asarray(probabilities, np.float64)
+    counts = simulate_counts(probabilities, simulations, np.random.default_rng(seed), shuffle, chunk_size)
+    
+    return counts / simulations
+
+
+def simulate_parallel(probabilities: np.ndarray,
+                      simulations: int,
+                      workers: Optional[int] = None,
+                      shuffle: bool = True,
+                      seed: Optional[int] = None,
+                      chunk_size: Optional[int] = None
+                      ) -> np.ndarray:
+    """
+    Like simulate, but splits the simulations across a pool of processes. Every worker uses its own independent random
+    number stream (spawned from the seed), so results are reproducible for the same seed and number of workers. The
+    probability matrix is shared with the workers through shared memory instead of being pickled for every worker.
+    :param probabilities: See simulate.
+    :param simulations: See simulate.
+    :param workers: Number of processes. Defaults to the number of CPUs.
+    :param shuffle: See simulate.
+    :param seed: See simulate.
+    :param chunk_size: See simulate.
+    :return: See simulate.
+    """
+    
+    probabilities = np.asarray(probabilities, np.float64)
+    n = len(probabilities)
+    workers = max(1, min(workers or os.cpu_count(), simulations))
+    
+    # Split simulations and random number streams
+    shares = [simulations // workers + (1 if i < simulations % workers else 0) for i in range(workers)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(workers)
+    
+    # Put the probability matrix into shared memory
+    shm = shared_memory.SharedMemory(create=True, size=max(1, probabilities.nbytes))
+    try:
+        np.ndarray(probabilities.shape, np.float64, buffer=shm.buf)[...] = probabilities
+        
+        # Run the shards and merge their counts
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_simulate_shard, shm.name, n, share, seed_sequence, shuffle, chunk_size)
+                       for share, seed_sequence in zip(shares, seed_sequences)]
+            counts = sum(future.result() for future in futures)
+    finally:
+        shm.close()
+        shm.unlink()
+    
+    return counts / simulations
+
+
+def _simulate_shard(shm_name: str,
+                    n: int,
+                    simulations: int,
+                    seed_sequence: np.random.SeedSequence,
+                    shuffle: bool,
+                    chunk_size: Optional[int]
+                    ) -> np.ndarray:
+    """Target for the worker processes of simulate_parallel. Attaches to the shared probability matrix and returns
+    the counts of simulate_counts."""
+    
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        probabilities = np.ndarray((n, n), np.float64, buffer=shm.buf)
+        counts = simulate_counts(probabilities, simulations, np.random.default_rng(seed_sequence), shuffle, chunk_size)
+        del probabilities  # The buffer can only be closed if no array uses it anymore
+    finally:
+        shm.close()
+    
+    return counts
+
+
+if __name__ == '__main__':
+    # Benchmark: 1M brackets with 64 competitors
+    import time
+    _ratings = np.random.default_rng(0).lognormal(size=64)
+    _start = time.perf_counter()
+    _reach = simulate(probabilities_from_ratings(_ratings), 1_000_000, seed=0)
+    print(f"1M simulations of a 64-competitor bracket: {time.perf_counter() - _start:.2f}s")
+    print("strongest competitor:", _ratings.argmax(), "win probability:", _reach[_ratings.argmax(), -1])
+    print("sum of win probabilities:", _reach[:, -1].sum())
+    
+    # Benchmark: 8M brackets with 1024 competitors, on all CPUs
+    _ratings = np.random.default_rng(0).lognormal(size=1024)
+    _start = time.perf_counter()
+    _reach = simulate_parallel(probabilities_from_ratings(_ratings), 8_000_000, seed=0)
+    print(f"8M simulations of a 1024-competitor bracket on {os.cpu_count()} CPUs: "
+          f"{time.perf_counter() - _start:.2f}s")
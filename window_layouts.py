@@ -1,10 +1,16 @@
 import PySimpleGUI as sg
 
+# Local project imports
+from Competitor import Competitor
+
 
 IMG_RES_MATCH = (325, 325)  # Image resolution during competition
 IMG_RES_WINNER = (325, 325)  # Image resolution when winner is shown
 IMG_RES_RANKS = (250, 250)  # Image resolution when all ranks are shown
 
+Competitor.register_resolutions(IMG_RES_MATCH, IMG_RES_WINNER, IMG_RES_RANKS)  # So that every image is only decoded
+        # once for all of them
+
 
 STANDARD_FONTS = {
     1: "Helvetica 8",
@@ -45,7 +51,10 @@ def exit_button(top_padding: int):
 pick_folder_column = [[sg.Button("Use images\nand names", key='-B_FOLDER-', size=(15, 3), font=std_font(3))],
                       [sg.Text("Use this button to chose a folder with one image file per competitor. Each image file"
                                "needs to be named \nas its corresponding competitor.", justification='left',
-                               size=(30, 4), font=std_font(4))]]
+                               size=(30, 4), font=std_font(4))],
+                      [sg.Checkbox("Prepare all images in advance (for large folders)", key='-PREPROCESS-',
+                                   font=std_font(2))],
+                      [sg.Checkbox("Leave out duplicate images", key='-DEDUPLICATE-', font=std_font(2))]]
 
 use_text_field_column = [[sg.Button("Use only names", key='-B_TEXT-', size=(15, 3), font=std_font(3))],
                          [sg.Text("Use this button to be provided with a text field in which you can put in all the"
@@ -72,6 +81,7 @@ right_image_column = sg.Column(right_image_column, element_justification='center
 
 main_layout = [*top_template(40),
                [sg.Text(size=(30, None), font=std_font(6), key='-ROUND_INFO-')],
+               [sg.Text(size=(30, None), font=std_font(1), key='-PREPROCESS_INFO-')],
                [sg.Text("Click on the image of either competitor to choose the winner.", font=std_font(2),
                         pad=((0, 0), (0, 15)))],
                [left_image_column, sg.VerticalSeparator(), right_image_column],
@@ -84,6 +94,8 @@ end_layout_1 = [*top_template(30),
                 [sg.Text(size=(30, 2), font=std_font(7), pad=((0, 30), (0, 0)), key='-WINNER_TITLE-')],
                 [sg.Image(size=IMG_RES_WINNER, key='-IMG_WINNER-')],
                 [sg.Button("Determine remaining ranks", size=(25, 2), key='-B_RUN_SECONDARY-', pad=((0, 0), (25, 0)))],
+                [sg.Text("Number of ranks to determine (leave empty for all):", font=std_font(2)),
+                    sg.Input(size=(6, 1), key='-RANKS_COUNT-')],
                 [exit_button(25)]]
 
 